@@ -0,0 +1,208 @@
+import sys
+import time
+import wave
+import shutil
+import threading
+import subprocess
+import numpy as np
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# samples handed to the sink at a time, about 23 ms
+BLOCK_SAMPLES = 1024
+
+SINKS = ["auto", "playsound", "device", "pipe", "null"]
+
+def decode_pcm(audio_file, rate=SAMPLE_RATE, channels=CHANNELS):
+    # the whole track as 16-bit samples, or None without an ffmpeg binary
+    # the binary is run directly so playing never has to import ffmpeg-python
+    if not shutil.which("ffmpeg"):
+        return None
+
+    command = ["ffmpeg", "-loglevel", "quiet", "-i", audio_file, "-f", "s16le", "-ac", str(channels), "-ar", str(rate), "pipe:"]
+    process = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+
+    if process.returncode != 0:
+        return None
+
+    return np.frombuffer(process.stdout, dtype="<i2").reshape(-1, channels)
+
+class NullSink:
+    # takes samples as fast as a sound card would play them, so the clock runs without one
+    latency = 0
+
+    def open(self, rate, channels):
+        self.rate = rate
+        self.channels = channels
+        self.written = 0
+        self.started = time.monotonic()
+
+    def write(self, data):
+        self.written += len(data) // (2 * self.channels)
+        delay = self.started + self.written / self.rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self, drain=False):
+        # drain is true at the end of the track, when what the sink still holds should be heard
+        pass
+
+class FileSink(NullSink):
+    # a null sink that also keeps what it was given as a wav file
+    def __init__(self, path):
+        self.path = path
+
+    def open(self, rate, channels):
+        super().open(rate, channels)
+        self.file = wave.open(self.path, "wb")
+        self.file.setnchannels(channels)
+        self.file.setsampwidth(2)
+        self.file.setframerate(rate)
+
+    def write(self, data):
+        self.file.writeframes(data)
+        super().write(data)
+
+    def close(self, drain=False):
+        self.file.close()
+
+class DeviceSink:
+    # needs the optional sounddevice package, which also reports the output latency
+    latency = 0
+
+    def open(self, rate, channels):
+        import sounddevice
+
+        self.stream = sounddevice.RawOutputStream(samplerate=rate, channels=channels, dtype="int16")
+        self.stream.start()
+        self.latency = self.stream.latency
+
+    def write(self, data):
+        self.stream.write(data)
+
+    def close(self, drain=False):
+        # stop plays out what the stream holds, abort drops it
+        if drain:
+            self.stream.stop()
+        else:
+            self.stream.abort()
+        self.stream.close()
+
+class PipeSink(NullSink):
+    # ffplay reading raw samples on stdin. ffplay queues about a second of its input whatever the pipe size,
+    # and never says what it has played, so samples are paced here to run only latency ahead of real time.
+    # the clock is then only as accurate as ffplay's start up, usually within a frame or two, DeviceSink is exact
+    def __init__(self, latency=0.2):
+        self.latency = latency
+
+    def open(self, rate, channels):
+        super().open(rate, channels)
+        self.started -= self.latency
+
+        command = ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-f", "s16le", "-ar", str(rate), "-ac", str(channels), "-"]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def write(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+        super().write(data)
+
+    def close(self, drain=False):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+        # -autoexit has ffplay quit once it has played what it still has queued
+        if not drain:
+            self.process.terminate()
+        self.process.wait()
+
+def make_sink(name="auto"):
+    # auto picks the most accurate sink this machine has
+    if name == "null":
+        return NullSink()
+    if name == "device":
+        return DeviceSink()
+    if name == "pipe":
+        return PipeSink()
+
+    try:
+        import sounddevice
+        return DeviceSink()
+    except (ImportError, OSError):
+        pass
+
+    if shutil.which("ffplay"):
+        return PipeSink()
+
+    print("No sound output found (install sounddevice or ffplay), playing without audio", file=sys.stderr)
+    return NullSink()
+
+class AudioClock:
+    # feeds the samples to the sink on a thread and tells how far playback has got from the samples it consumed,
+    # so video can follow the audio instead of a separate timer
+    def __init__(self, samples, sink, rate=SAMPLE_RATE, block=BLOCK_SAMPLES, clock=time.monotonic):
+        self.samples = samples
+        self.sink = sink
+        self.rate = rate
+        self.block = block
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.feed, daemon=True)
+
+        self.consumed = 0
+        self.updated = None
+        self.finished = False
+
+    def feed(self):
+        self.sink.open(self.rate, self.samples.shape[1])
+
+        try:
+            for offset in range(0, len(self.samples), self.block):
+                if self.stopped.is_set():
+                    break
+
+                data = self.samples[offset:offset + self.block]
+                self.sink.write(data.tobytes())
+
+                with self.lock:
+                    self.consumed = offset + len(data)
+                    self.updated = self.clock()
+
+        finally:
+            with self.lock:
+                self.finished = True
+            # the last samples written are still to be played unless playback was stopped
+            self.sink.close(drain=not self.stopped.is_set())
+
+    def start(self):
+        self.updated = self.clock()
+        self.thread.start()
+
+    def position(self):
+        # seconds of audio heard so far
+        with self.lock:
+            consumed, updated, finished = self.consumed, self.updated, self.finished
+
+        if updated is None:
+            return 0
+
+        # the sink plays on between writes, but never further than the block it already has,
+        # once the audio has run out the clock carries on by itself
+        elapsed = self.clock() - updated
+        if not finished:
+            elapsed = min(elapsed, self.block / self.rate)
+
+        return max(consumed / self.rate - self.sink.latency + elapsed, 0)
+
+    def wait(self):
+        # until every sample has gone to the sink
+        self.thread.join()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
@@ -2,13 +2,16 @@ import os
 import shutil
 from yt_dlp import YoutubeDL
 import ffmpeg
-from PIL import Image
 import multiprocessing
 from playsound import playsound
-import time
 import json
 
 from reset import reset_files
+from convert import SHADING, pixel_size, convert_frames
+from clock import FrameScheduler
+from sequence import TextSequence
+from prefetch import BUFFER_MB, PrefetchBuffer
+from frames import stream_frames, estimate_frame_count, extract_png_frames, png_frames, count_png_frames
 
 if not os.path.isfile("config.json"):
     # do not change these, instead change them in config.json which gets generated
@@ -21,7 +24,14 @@ if not os.path.isfile("config.json"):
         "skip_setup": False,
         "auto_reset": False,
         "delete_frames": False,
-        "shading": [" ", ".", ":", "=", "#"]
+        "stream_frames": True,
+        "workers": 0,
+        "color_tolerance": 0,
+        "drop_frames": True,
+        "ahead_mode": "hold",
+        "cell_encoding": "cell",
+        "buffer_mb": 64,
+        "shading": list(SHADING)
     }
 
     with open("config.json", "w") as f:
@@ -74,68 +84,46 @@ if not(os.path.isfile(ascii_file) and os.path.isfile(audio_file) and config["ski
     stream = custom_output(stream, "assets/audio.mp3")
     stream.run()
 
-    if not config["quiet"]:
-        print()
-
-    print("[3/4] Extracting frames from video...")
-    if os.path.isdir("frames"):
-        shutil.rmtree("frames")
-    os.mkdir("frames")
-    
-    stream = ffmpeg.input(video_file)
-    stream = stream.filter("fps", fps=str(config["framerate"]))
-    stream = custom_output(stream, "frames/frame_%06d.png")
-    stream.run()
-
     if not config["quiet"]:
         print()
 
     terminal_size = os.get_terminal_size()
-    print(f"[4/4] Generating ASCII art from frames... ({terminal_size.columns}x{terminal_size.lines})")
-    text_frames = []
-    frame_files = os.listdir("frames")
-    frame_files.sort()
-    count = 0
-
-    for frame in frame_files:
-        path = os.path.join("frames", frame)
-
-        image = Image.open(path)
-        image = image.resize((terminal_size.columns, terminal_size.lines - 1))
-        image = image.convert("RGB")
-        
-        text_frame = ""
+    frame_size = pixel_size((terminal_size.columns, terminal_size.lines - 1), config.get("cell_encoding", "cell"))
 
-        for pixel_rgb in list(image.getdata()):
-            r = pixel_rgb[0]
-            g = pixel_rgb[1]
-            b = pixel_rgb[2]
+    if config.get("stream_frames", True):
+        print("[3/4] Streaming frames from ffmpeg...")
 
-            brightness = int((r + g + b) / 3)
+        frames = stream_frames(video_file, config["framerate"], frame_size, gray=not config["color"], quiet=config["quiet"])
+        frame_count = estimate_frame_count(video_file, config["framerate"])
 
-            if brightness <= 51:    pixel = config["shading"][0]
-            elif brightness <= 102: pixel = config["shading"][1]
-            elif brightness <= 153: pixel = config["shading"][2]
-            elif brightness <= 204: pixel = config["shading"][3]
-            elif brightness <= 255: pixel = config["shading"][4]
-            else:                   pixel = "?"
+    else:
+        print("[3/4] Extracting frames from video...")
+        if os.path.isdir("frames"):
+            shutil.rmtree("frames")
+        os.mkdir("frames")
 
-            if config["color"]: pixel = f"\033[38;2;{r};{g};{b}m{pixel}"
+        extract_png_frames(video_file, config["framerate"], config["quiet"])
 
-            text_frame += pixel
+        frames = png_frames(frame_size)
+        frame_count = count_png_frames()
 
-        text_frames.append(text_frame)
-        count += 1
+    if not config["quiet"]:
+        print()
 
-        if not config["quiet"] and (count % 100 == 0 or count == len(frame_files)):
-            print(f"Processed {count} frames, {round(count / len(frame_files) * 100, 2)}% complete")
+    print(f"[4/4] Generating ASCII art from frames... ({terminal_size.columns}x{terminal_size.lines})")
+    count = 0
 
-    if os.path.isfile(ascii_file):
-        os.remove(ascii_file)
+    # frames go straight to the file instead of piling up in memory
+    with open(ascii_file, "w") as f:
+        for text_frame in convert_frames(frames, config["shading"], config["color"], config.get("workers", 0), color_runs=True, tolerance=config.get("color_tolerance", 0), encoding=config.get("cell_encoding", "cell")):
+            f.write(text_frame + "\n")
+            count += 1
 
-    with open(ascii_file, "a") as f:
-        for frame in text_frames:
-            f.write(frame + "\n")
+            if not config["quiet"] and (count % 100 == 0 or count == frame_count):
+                if frame_count:
+                    print(f"Processed {count} frames, {round(min(count / frame_count, 1) * 100, 2)}% complete")
+                else:
+                    print(f"Processed {count} frames")
 
     if config["delete_frames"]:
         try:
@@ -144,9 +132,6 @@ if not(os.path.isfile(ascii_file) and os.path.isfile(audio_file) and config["ski
             pass
 
 else:
-    with open(ascii_file, "r") as f:
-        text_frames = f.read().splitlines()
-
     print("Skipped setup, using cached audio and ASCII!")
 
 if config["color"]: print("\033[0m")
@@ -155,17 +140,24 @@ input("\n[READY] Bad Apple!! is ready. Press enter to play." )
 
 os.system(clear_command)
 
-multiprocessing.set_start_method("fork")
-play_audio = multiprocessing.Process(target=playsound, args=(audio_file,), daemon=True)
+# fork is asked for on this process alone, the default cannot be set once the conversion pool above has used it
+play_audio = multiprocessing.get_context("fork").Process(target=playsound, args=(audio_file,), daemon=True)
 play_audio.start()
 
-for frame in text_frames:
+scheduler = FrameScheduler(config["framerate"], config.get("drop_frames", True), config.get("ahead_mode", "hold"))
+text_frames = TextSequence(ascii_file)
+buffer = PrefetchBuffer(text_frames, config.get("buffer_mb", BUFFER_MB) * 2**20)
+
+for frame in scheduler.paced(buffer):
     print(frame)
-    time.sleep(1 / config["framerate"])
+
+text_frames.close()
 
 if play_audio.is_alive():
     play_audio.terminate()
 
 if config["color"]: print("\033[0m")
 
+print(f"\nPlayback: {scheduler.report()}")
+print(f"Buffer: {buffer.report()}")
 print("\nThanks for watching!")
\ No newline at end of file
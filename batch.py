@@ -0,0 +1,303 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+import concurrent.futures
+
+from convert import UNICODE_BLOCK, SHADING, ENCODINGS, pixel_size, convert_frames, resolve_workers
+from sequence import COMPRESSIONS, SequenceWriter
+from frames import stream_frames
+from rerender import decode_size, master_writer, record_master
+from render_cache import source_id, render_key, find_render, replace_render, cache_render
+
+STORED_DIR = "stored"
+WORK_DIR = os.path.join("cache", "batch")
+
+# per-job overrides a job file can set, everything else comes from the command line
+JOB_OPTIONS = ["framerate", "size", "color", "shade", "shading", "tolerance", "encoding", "compression", "master"]
+
+print_lock = threading.Lock()
+
+def log(name, message):
+    with print_lock:
+        print(f"[{name}] {message}", flush=True)
+
+def is_url(source):
+    return "http://" in source or "https://" in source
+
+def job_name(source):
+    # the youtube video id, or the file name without its extension
+    match = re.search(r"[?&]v=([\w-]+)", source)
+
+    if match:
+        name = match.group(1)
+    elif is_url(source):
+        name = source.rstrip("/").rsplit("/", 1)[-1]
+    else:
+        name = os.path.splitext(os.path.basename(source))[0]
+
+    return re.sub(r"[^\w.-]+", "_", name) or "render"
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return [int(width), int(height)]
+
+def read_job_file(path):
+    # either a json list of {"source": ..., "name": ..., options...},
+    # or one "source [name]" per line with # comments
+    with open(path, "r") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+
+        jobs = []
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+
+            source, *name = line.split(None, 1)
+            jobs.append({"source": source, "name": name[0] if name else None})
+
+        return jobs
+
+def build_jobs(args):
+    jobs = [{"source": source} for source in args.sources]
+
+    for job_file in args.job_file or []:
+        jobs += read_job_file(job_file)
+
+    names = set()
+    for job in jobs:
+        for option in JOB_OPTIONS:
+            job.setdefault(option, getattr(args, option))
+
+        if isinstance(job["size"], str):
+            job["size"] = parse_size(job["size"])
+
+        # two jobs with the same name would overwrite each other
+        name = job.get("name") or job_name(job["source"])
+        unique = name
+        number = 2
+
+        while unique in names:
+            unique = f"{name}-{number}"
+            number += 1
+
+        job["name"] = unique
+        names.add(unique)
+
+    return jobs
+
+class Limits:
+    # downloads wait on the network and conversions on the cpu, so each has its own number of slots
+    def __init__(self, downloads, conversions):
+        self.downloads = threading.Semaphore(downloads)
+        self.conversions = threading.Semaphore(conversions)
+
+class Timings:
+    def __init__(self):
+        self.seconds = {}
+        self.started = time.perf_counter()
+
+    def stage(self, name, semaphore=None):
+        return TimedStage(self, name, semaphore)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+class TimedStage:
+    # time spent waiting for a slot is kept apart from the time the stage itself took
+    def __init__(self, timings, name, semaphore):
+        self.timings = timings
+        self.name = name
+        self.semaphore = semaphore
+
+    def __enter__(self):
+        start = time.perf_counter()
+        if self.semaphore:
+            self.semaphore.acquire()
+            self.timings.seconds[f"{self.name}_wait"] = time.perf_counter() - start
+
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.timings.seconds[self.name] = time.perf_counter() - self.start
+        if self.semaphore:
+            self.semaphore.release()
+
+def render(job, limits, workers, cache_bytes=0, overwrite=False):
+    # the download and video backends are slow to import, and spawned conversion workers would load them again
+    import ffmpeg
+
+    name = job["name"]
+    store_dir = os.path.join(STORED_DIR, name)
+    work_dir = os.path.join(WORK_DIR, name)
+    timings = Timings()
+    result = {"name": name, "source": job["source"], "status": "done", "frames": 0, "timings": timings.seconds}
+
+    if os.path.isdir(store_dir) and not overwrite:
+        result["status"] = "exists"
+        log(name, f"'{store_dir}' already exists, skipping (use --overwrite)")
+        return result
+
+    shading = job["shading"] if job["shade"] else None
+    terminal_size = job["size"]
+
+    if not is_url(job["source"]) and not os.path.isfile(job["source"]):
+        result["status"] = "missing"
+        log(name, f"There is no file at '{job['source']}'")
+        return result
+
+    key = render_key(source_id(job["source"]), job["framerate"], terminal_size, job["shade"], job["shading"], job["color"], job["tolerance"], job["encoding"])
+    # a cache size of 0 turns the cache off, stored renders included
+    cached = find_render(key) if cache_bytes > 0 else None
+
+    if cached and os.path.abspath(cached) == os.path.abspath(store_dir):
+        result["status"] = "exists"
+        log(name, f"'{store_dir}' already has these settings, nothing to do")
+        return result
+
+    if cached:
+        with timings.stage("store"):
+            replace_render(cached, store_dir)
+
+        result["status"] = "cached"
+        result["timings"]["total"] = timings.total()
+        log(name, f"Already rendered with these settings, copied from '{cached}'")
+        return result
+
+    if os.path.isdir(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+
+    try:
+        if is_url(job["source"]):
+            video_file = os.path.join(work_dir, "video.webm")
+
+            with timings.stage("download", limits.downloads):
+                log(name, "Downloading")
+                from yt_dlp import YoutubeDL
+                YoutubeDL({"outtmpl": video_file, "quiet": True, "noprogress": True}).download([job["source"]])
+
+        else:
+            video_file = job["source"]
+
+        with timings.stage("audio", limits.conversions):
+            ffmpeg.input(video_file).output(os.path.join(work_dir, "audio.mp3"), loglevel="quiet").run()
+
+        frame_size = pixel_size((terminal_size[0], terminal_size[1] - 1), job["encoding"])
+        source_size = decode_size(frame_size) if job["master"] else frame_size
+
+        infos = {
+            "framerate": job["framerate"],
+            "terminal_size": terminal_size,
+            "color": job["color"],
+            "shading": shading if shading else UNICODE_BLOCK,
+            "cell_encoding": job["encoding"],
+            "render_key": key
+        }
+
+        if job["color"]:
+            infos["color_encoding"] = "runs"
+            infos["color_tolerance"] = job["tolerance"]
+
+        with timings.stage("convert", limits.conversions):
+            log(name, f"Converting at {terminal_size[0]}x{terminal_size[1]}")
+
+            frames = stream_frames(video_file, job["framerate"], source_size, gray=not (job["color"] or job["master"]), quiet=True)
+            master = None
+
+            if job["master"]:
+                master = master_writer(os.path.join(work_dir, "master.bin"), job["framerate"], {"framerate": job["framerate"]})
+                frames = record_master(frames, master, frame_size)
+
+            try:
+                with SequenceWriter(os.path.join(work_dir, "sequence.bin"), terminal_size, job["framerate"], infos, job["compression"]) as writer:
+                    # jobs run on threads, forking a pool from one could leave a worker stuck on a lock another job holds
+                    for text_frame in convert_frames(frames, shading, job["color"], workers, start_method="spawn", color_runs=True, tolerance=job["tolerance"], encoding=job["encoding"]):
+                        writer.write(text_frame)
+                        result["frames"] += 1
+
+            finally:
+                if master:
+                    master.close()
+
+        with open(os.path.join(work_dir, "info.json"), "w") as f:
+            json.dump(infos, f, indent=4)
+
+        with timings.stage("store"):
+            replace_render(work_dir, store_dir)
+
+        if cache_bytes > 0:
+            cache_render(store_dir, key, cache_bytes)
+
+        log(name, f"Stored {result['frames']} frames in '{store_dir}'")
+
+    except Exception as error:
+        result["status"] = "failed"
+        result["error"] = str(error) or type(error).__name__
+        log(name, f"[ERROR] {result['error']}")
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    result["timings"]["total"] = timings.total()
+    return result
+
+def print_summary(results):
+    stages = ["download_wait", "download", "audio_wait", "audio", "convert_wait", "convert", "store", "total"]
+
+    print()
+    print(f"{'name':<24} {'status':<8} {'frames':>7} " + " ".join(f"{stage:>13}" for stage in stages))
+
+    for result in results:
+        seconds = " ".join(f"{result['timings'][stage]:>12.1f}s" if stage in result["timings"] else f"{'-':>13}" for stage in stages)
+        print(f"{result['name']:<24} {result['status']:<8} {result['frames']:>7} {seconds}")
+
+if __name__ == "__main__":
+    size = shutil.get_terminal_size()
+
+    parser = argparse.ArgumentParser(description="Render many videos without the menus and store each one in stored/<name>")
+    parser.add_argument("sources", nargs="*", help="video URLs or local paths")
+    parser.add_argument("--job-file", action="append", help="file with one 'source [name]' per line, or a .json list of jobs which can override any render option")
+    parser.add_argument("--jobs", type=int, default=2, help="jobs running at the same time (default 2)")
+    parser.add_argument("--downloads", type=int, default=2, help="downloads running at the same time (default 2)")
+    parser.add_argument("--conversions", type=int, default=1, help="audio extractions and conversions running at the same time (default 1)")
+    parser.add_argument("--workers", type=int, default=0, help="processes per conversion, 0 is one per CPU core (default 0)")
+    parser.add_argument("--framerate", type=int, default=30)
+    parser.add_argument("--size", default=f"{size.columns}x{size.lines}", help="terminal size as WxH (default the current terminal)")
+    parser.add_argument("--color", action="store_true")
+    parser.add_argument("--no-shade", dest="shade", action="store_false", help=f"draw every pixel as {UNICODE_BLOCK}")
+    parser.add_argument("--shading", nargs=5, default=SHADING, metavar="CHAR", help="5 shading characters, in the same order as in config.json")
+    parser.add_argument("--tolerance", type=int, default=0, help="color tolerance (default 0)")
+    parser.add_argument("--encoding", choices=ENCODINGS, default="cell")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="zlib")
+    parser.add_argument("--no-master", dest="master", action="store_false", help="do not keep a master copy for other terminal sizes")
+    parser.add_argument("--cache-mb", type=int, default=4096, help="size of the generated video cache, 0 turns it off (default 4096)")
+    parser.add_argument("--overwrite", action="store_true", help="replace renders that already exist in stored/")
+    parser.add_argument("--summary", metavar="FILE", help="also write the per-job results as json")
+    args = parser.parse_args()
+
+    jobs = build_jobs(args)
+    if not jobs:
+        parser.error("no sources or job files given")
+
+    limits = Limits(args.downloads, args.conversions)
+    workers = resolve_workers(args.workers)
+    print(f"Rendering {len(jobs)} jobs, {args.jobs} at a time ({args.downloads} downloads, {args.conversions} conversions with {workers} workers each)")
+
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as executor:
+        results = list(executor.map(lambda job: render(job, limits, workers, args.cache_mb * 2**20, args.overwrite), jobs))
+
+    print_summary(results)
+
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if any(result["status"] in ["failed", "missing"] for result in results):
+        sys.exit(1)
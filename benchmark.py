@@ -0,0 +1,442 @@
+import os
+import sys
+import pty
+import json
+import time
+import wave
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+from delta import delta_frames
+from output import FrameOutput
+from sequence import SequenceWriter
+from clock import FrameScheduler
+from audio import SAMPLE_RATE, CHANNELS, AudioClock, NullSink, FileSink
+from quality import calibrate, to_256, to_shading
+from convert import SHADING, frame_to_text, frame_to_text_loop, convert_frames, resolve_workers
+
+SIZES = [(80, 23), (160, 47), (240, 67)]
+VIDEO_SIZES = [(640, 360), (1280, 720)]
+VIDEO_SECONDS = [2, 10]
+SYNC_SECONDS = 5
+FRAMERATE = 30
+
+# a result counts as a regression when it is this much slower than the old one
+REGRESSION = 0.9
+# units where a smaller value is better
+LOWER_IS_BETTER = ["KiB/s", "KiB", "ms"]
+
+# playing a saved render must not load any of these
+BACKENDS = ["yt_dlp", "ffmpeg", "PIL"]
+STARTUP_RUNS = 5
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+
+# what play() does before the first frame: load the menu's modules, open the render and read a frame
+FIRST_FRAME = f"""
+import sys
+sys.path.insert(0, {REPOSITORY!r})
+import interactive
+from sequence import open_sequence, read_info
+read_info("stored/startup")
+open_sequence("stored/startup")[0]
+"""
+
+MODES = {
+    "shade": (SHADING, False),
+    "block": (None, False),
+    "color": (SHADING, True),
+    "block+color": (None, True)
+}
+
+results = []
+
+def record(stage, name, size, value, unit="fps"):
+    results.append({"stage": stage, "name": name, "size": f"{size[0]}x{size[1]}", "value": round(value, 2), "unit": unit})
+
+def result_key(result):
+    return f"{result['stage']}/{result['name']}/{result['size']}"
+
+def random_frames(size, count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8) for _ in range(count)]
+
+def silhouette_frames(size, count):
+    # a white circle moving over a black background, roughly what Bad Apple!! looks like
+    width, height = size
+    rows, columns = np.mgrid[0:height, 0:width]
+    frames = []
+
+    for index in range(count):
+        x = width * (0.2 + 0.6 * index / count)
+        mask = ((columns - x) / 2) ** 2 + (rows - height / 2) ** 2 < (height / 3) ** 2
+
+        pixels = np.zeros((height, width, 3), dtype=np.uint8)
+        pixels[mask] = 255
+        frames.append(pixels)
+
+    return frames
+
+def frames_per_second(function, frames, shading, color):
+    start = time.perf_counter()
+    for pixels in frames:
+        function(pixels, shading, color)
+    return len(frames) / (time.perf_counter() - start)
+
+def bench_conversion(count, compare_loop):
+    print("Conversion throughput" + (", old per-pixel loop vs vectorized converter" if compare_loop else ""))
+
+    for size in SIZES:
+        frames = random_frames(size, count)
+
+        for mode, (shading, color) in MODES.items():
+            for pixels in frames[:3]:
+                if frame_to_text(pixels, shading, color) != frame_to_text_loop(pixels, shading, color):
+                    print(f"[ERROR] Output mismatch at {size[0]}x{size[1]} in {mode} mode")
+                    sys.exit(1)
+
+            new = frames_per_second(frame_to_text, frames, shading, color)
+            record("conversion", mode, size, new)
+
+            if compare_loop:
+                old = frames_per_second(frame_to_text_loop, frames, shading, color)
+                record("conversion", mode + "/loop", size, old)
+                print(f"  {size[0]}x{size[1]} {mode:<12} loop {old:8.1f} fps   vectorized {new:8.1f} fps   ({new / old:.1f}x)")
+            else:
+                print(f"  {size[0]}x{size[1]} {mode:<12} {new:8.1f} fps")
+
+def bench_workers(count):
+    print("Color conversion throughput by worker count")
+
+    frames = random_frames(SIZES[-1], count * 10)
+    workers = 1
+
+    while workers <= resolve_workers(0):
+        start = time.perf_counter()
+        for _ in convert_frames(iter(frames), SHADING, True, workers):
+            pass
+        fps = len(frames) / (time.perf_counter() - start)
+
+        record("workers", str(workers), SIZES[-1], fps)
+        print(f"  {workers:>3} workers {fps:8.1f} fps")
+        workers *= 2
+
+def bench_delta(count):
+    print(f"Terminal output at {FRAMERATE} FPS, full redraw vs delta")
+
+    for size in SIZES:
+        frames = silhouette_frames(size, count * 5)
+
+        for mode, (shading, color) in MODES.items():
+            text_frames = [frame_to_text(pixels, shading, color) for pixels in frames]
+
+            start = time.perf_counter()
+            deltas = list(delta_frames(text_frames, size[0]))
+            diffing = len(text_frames) / (time.perf_counter() - start)
+
+            full = sum(len((frame + "\n").encode()) for frame in text_frames)
+            delta = sum(len(frame.encode()) for frame in deltas)
+            seconds = len(text_frames) / FRAMERATE
+
+            record("bytes", mode + "/full", size, full / seconds / 1024, "KiB/s")
+            record("bytes", mode + "/delta", size, delta / seconds / 1024, "KiB/s")
+            record("delta", mode, size, diffing)
+            print(f"  {size[0]}x{size[1]} {mode:<12} full {full / seconds / 1024:9.1f} KiB/s   delta {delta / seconds / 1024:9.1f} KiB/s   ({full / delta:.1f}x less, diffing {diffing:.0f} fps)")
+
+def open_sink(kind):
+    # a pty behaves like a real terminal, its other end is drained and thrown away
+    if kind == "null":
+        return open(os.devnull, "w"), None
+
+    master, slave = pty.openpty()
+
+    def drain():
+        try:
+            while os.read(master, 65536):
+                pass
+        except OSError:
+            pass
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+    return os.fdopen(slave, "w"), master
+
+def bench_playback(count):
+    print("Unpaced playback output, frames per second (write is one os.write per pre-encoded frame)")
+
+    for kind in ["null", "pty"]:
+        for size in SIZES:
+            frames = silhouette_frames(size, count * 5)
+
+            for mode, (shading, color) in MODES.items():
+                text_frames = [frame_to_text(pixels, shading, color) for pixels in frames]
+                deltas = list(delta_frames(text_frames, size[0]))
+                sink, master = open_sink(kind)
+
+                start = time.perf_counter()
+                for frame in text_frames:
+                    print(frame, file=sink)
+                sink.flush()
+                full = len(text_frames) / (time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for frame in deltas:
+                    sink.write(frame)
+                    sink.flush()
+                delta = len(text_frames) / (time.perf_counter() - start)
+
+                output = FrameOutput(sink.fileno(), synchronized=True)
+                encoded = [output.encode(frame) for frame in text_frames]
+
+                start = time.perf_counter()
+                for frame in encoded:
+                    output.write(frame)
+                write = len(text_frames) / (time.perf_counter() - start)
+
+                sink.close()
+                if master is not None:
+                    os.close(master)
+
+                record(f"playback/{kind}", mode + "/print", size, full)
+                record(f"playback/{kind}", mode + "/delta", size, delta)
+                record(f"playback/{kind}", mode + "/write", size, write)
+                print(f"  {kind:<4} {size[0]}x{size[1]} {mode:<12} print {full:9.1f} fps   write {write:9.1f} fps   delta {delta:9.1f} fps")
+
+def bench_quality(count):
+    print("Adaptive quality, bytes per color frame at every level and how fast frames are converted to it")
+
+    for size in SIZES:
+        # the pty is what calibration would measure on a terminal that is never behind
+        sink, master = open_sink("pty")
+        throughput = calibrate(sink.fileno(), size, 0.2)
+        sink.close()
+        os.close(master)
+        record("quality", "calibration", size, throughput / 2**20, "MiB/s")
+
+        text_frames = [frame_to_text(pixels, None, True, color_runs=True) for pixels in random_frames(size, count)]
+        line = f"  {size[0]}x{size[1]} pty {throughput / 2**20:7.1f} MiB/s  "
+
+        for level, convert in [("truecolor", None), ("256color", to_256), ("shading", to_shading)]:
+            start = time.perf_counter()
+            converted = [convert(frame) for frame in text_frames] if convert else text_frames
+            fps = len(text_frames) / max(time.perf_counter() - start, 1e-9)
+
+            size_kib = sum(len(frame.encode()) for frame in converted) / len(converted) / 1024
+            record("quality", level + "/bytes", size, size_kib, "KiB")
+            line += f"  {level} {size_kib:6.1f} KiB"
+
+            if convert:
+                record("quality", level, size, fps)
+                line += f" ({fps:6.0f} fps)"
+
+        print(line)
+
+def bench_sync():
+    print(f"Audio/video sync over {SYNC_SECONDS} s, frames paced by the audio clock feeding a null and a file sink")
+
+    # a quiet 440 Hz tone, only its length matters
+    times = np.arange(SAMPLE_RATE * SYNC_SECONDS) / SAMPLE_RATE
+    tone = (np.sin(2 * np.pi * 440 * times) * 3000).astype("<i2")
+    samples = np.repeat(tone[:, None], CHANNELS, axis=1)
+
+    work = tempfile.mkdtemp()
+
+    try:
+        for kind, sink in [("null", NullSink()), ("file", FileSink(os.path.join(work, "sync.wav")))]:
+            audio = AudioClock(samples, sink)
+            scheduler = FrameScheduler(FRAMERATE, clock=audio.position)
+            errors = []
+
+            audio.start()
+            for number in scheduler.paced(range(SYNC_SECONDS * FRAMERATE)):
+                # how far the audio is from where this frame belongs, when the frame goes out
+                errors.append(abs(audio.position() - number / FRAMERATE))
+            audio.wait()
+
+            errors.sort()
+            mean = sum(errors) / len(errors) * 1000
+            worst = errors[-1] * 1000
+
+            record("sync", kind + "/mean", SIZES[0], mean, "ms")
+            record("sync", kind + "/max", SIZES[0], worst, "ms")
+            print(f"  {kind:<4} mean offset {mean:6.2f} ms   worst {worst:6.2f} ms   ({scheduler.report()})")
+
+        with wave.open(os.path.join(work, "sync.wav"), "rb") as f:
+            if f.getnframes() != len(samples):
+                print(f"[ERROR] The file sink kept {f.getnframes()} of {len(samples)} samples")
+                sys.exit(1)
+
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+def bench_extraction():
+    print("Frame extraction, ffmpeg pipe vs PNG files")
+
+    if not shutil.which("ffmpeg"):
+        print("  ffmpeg is not installed, skipping")
+        return
+
+    import ffmpeg
+    from frames import stream_frames, extract_png_frames, png_frames
+
+    directory = os.getcwd()
+    work = tempfile.mkdtemp()
+    os.chdir(work)
+
+    try:
+        for video_size in VIDEO_SIZES:
+            for seconds in VIDEO_SECONDS:
+                video = f"testsrc_{video_size[0]}x{video_size[1]}_{seconds}s.webm"
+                source = ffmpeg.input(f"testsrc=size={video_size[0]}x{video_size[1]}:rate={FRAMERATE}:duration={seconds}", f="lavfi")
+                source.output(video, loglevel="quiet").run()
+
+                for size in SIZES:
+                    start = time.perf_counter()
+                    count = sum(1 for _ in stream_frames(video, FRAMERATE, size, quiet=True))
+                    pipe = count / (time.perf_counter() - start)
+
+                    shutil.rmtree("frames", ignore_errors=True)
+                    os.mkdir("frames")
+
+                    start = time.perf_counter()
+                    extract_png_frames(video, FRAMERATE, quiet=True)
+                    count = sum(1 for _ in png_frames(size))
+                    png = count / (time.perf_counter() - start)
+
+                    name = f"{video_size[0]}x{video_size[1]}/{seconds}s"
+                    record("extraction", name + "/pipe", size, pipe)
+                    record("extraction", name + "/png", size, png)
+                    print(f"  {name:<16} to {size[0]}x{size[1]:<4} pipe {pipe:8.1f} fps   png {png:8.1f} fps")
+
+    finally:
+        os.chdir(directory)
+        shutil.rmtree(work, ignore_errors=True)
+
+def imported_modules(importtime):
+    # -X importtime writes "import time: self | cumulative | module" for every import
+    modules = set()
+
+    for line in importtime.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+
+    return modules
+
+def cold_start(arguments, directory, stdin=""):
+    # fastest of a few fresh interpreters, and what the last one imported
+    fastest = None
+
+    for _ in range(STARTUP_RUNS):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, "-X", "importtime", *arguments], cwd=directory, input=stdin, capture_output=True, text=True)
+        seconds = time.perf_counter() - start
+
+        if process.returncode != 0:
+            print(f"[ERROR] {' '.join(arguments)} failed:\n{process.stderr[-2000:]}")
+            sys.exit(1)
+
+        fastest = seconds if fastest is None else min(fastest, seconds)
+
+    return fastest, imported_modules(process.stderr)
+
+def bench_startup():
+    print("Cold start, fastest of a few runs")
+
+    work = tempfile.mkdtemp()
+    os.makedirs(os.path.join(work, "stored", "startup"))
+
+    frames = [frame_to_text(pixels, SHADING) for pixels in silhouette_frames(SIZES[0], 10)]
+    with SequenceWriter(os.path.join(work, "stored", "startup", "sequence.bin"), [SIZES[0][0], SIZES[0][1] + 1], FRAMERATE, {"framerate": FRAMERATE}, "zlib") as writer:
+        for frame in frames:
+            writer.write(frame)
+
+    try:
+        # the menu is shown and quit straight away
+        menu, menu_modules = cold_start([os.path.join(REPOSITORY, "interactive.py")], work, "6\n")
+        first_frame, play_modules = cold_start(["-c", FIRST_FRAME], work)
+
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    record("startup", "menu", SIZES[0], menu * 1000, "ms")
+    record("startup", "first_frame", SIZES[0], first_frame * 1000, "ms")
+    print(f"  time to menu {menu * 1000:8.1f} ms   time to first frame {first_frame * 1000:8.1f} ms")
+
+    loaded = [backend for backend in BACKENDS if backend in menu_modules | play_modules]
+    if loaded:
+        print(f"[ERROR] Showing the menu or playing a saved render imported {', '.join(loaded)}")
+        sys.exit(1)
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(old_file, new_results):
+    with open(old_file, "r") as f:
+        old = json.load(f)
+
+    print(f"Compared with {old_file} (commit {old.get('commit')})")
+    old_results = {result_key(result): result for result in old["results"]}
+    regressions = 0
+
+    for result in new_results:
+        previous = old_results.get(result_key(result))
+        if not previous or not previous["value"]:
+            continue
+
+        ratio = result["value"] / previous["value"]
+        if result["unit"] in LOWER_IS_BETTER:
+            ratio = 1 / ratio if ratio else float("inf")
+
+        if ratio < REGRESSION:
+            regressions += 1
+            print(f"  [REGRESSION] {result_key(result)}: {previous['value']} -> {result['value']} {result['unit']}")
+
+    print(f"  {regressions} regressions")
+    return regressions
+
+SECTIONS = {
+    "conversion": lambda args: bench_conversion(args.frames, not args.no_loop),
+    "workers": lambda args: bench_workers(args.frames),
+    "delta": lambda args: bench_delta(args.frames),
+    "playback": lambda args: bench_playback(args.frames),
+    "extraction": lambda args: bench_extraction(),
+    "startup": lambda args: bench_startup(),
+    "quality": lambda args: bench_quality(args.frames),
+    "sync": lambda args: bench_sync()
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks for extraction, conversion and playback")
+    parser.add_argument("frames", nargs="?", type=int, default=20, help="frames per measurement (default 20)")
+    parser.add_argument("--only", nargs="+", choices=SECTIONS, help="only run these sections")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the results (default benchmark.json)")
+    parser.add_argument("--compare", metavar="OLD", help="results file from an older commit to check for regressions")
+    parser.add_argument("--no-loop", action="store_true", help="skip the slow reference per-pixel loop")
+    args = parser.parse_args()
+
+    for name in args.only or SECTIONS:
+        SECTIONS[name](args)
+        print()
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": current_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "frames": args.frames,
+            "results": results
+        }, f, indent=4)
+
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.compare and compare(args.compare, results):
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,73 @@
+import time
+
+AHEAD_MODES = ["hold", "slew"]
+
+class FrameScheduler:
+    # every frame has an absolute deadline, origin + number / framerate, so time spent
+    # printing is never added on top of the frame period and playback cannot drift
+    def __init__(self, framerate, drop=True, ahead="hold", slew=0.1, clock=time.monotonic):
+        if ahead not in AHEAD_MODES:
+            raise ValueError(f"Unknown ahead mode '{ahead}'")
+
+        self.framerate = framerate
+        self.period = 1 / framerate
+        self.drop = drop
+        self.ahead = ahead
+        self.slew = slew
+        self.clock = clock
+        self.origin = None
+
+        self.on_time = 0
+        self.late = 0
+        self.dropped = 0
+
+    def start(self):
+        self.origin = self.clock()
+
+    def wait(self, number):
+        # returns False if the frame should be dropped because the next one is already due
+        if self.origin is None:
+            self.start()
+
+        deadline = self.origin + number * self.period
+        now = self.clock()
+
+        if self.drop and now - deadline >= self.period:
+            self.dropped += 1
+            return False
+
+        if now < deadline:
+            # slew only sleeps a little longer than one period at a time,
+            # so a clock that jumped ahead is caught up over several frames
+            delay = deadline - now
+            if self.ahead == "slew":
+                delay = min(delay, self.period * (1 + self.slew))
+
+            time.sleep(delay)
+            now = self.clock()
+
+        if now - deadline > self.period / 2:
+            self.late += 1
+        else:
+            self.on_time += 1
+
+        return True
+
+    def paced(self, frames):
+        # yields each frame when it is due, leaving out dropped ones
+        for _, frame in self.numbered(frames):
+            yield frame
+
+    def numbered(self, frames):
+        # paced, with the number each frame had in the source so dropped ones still count
+        self.start()
+
+        for number, frame in enumerate(frames):
+            if self.wait(number):
+                yield number, frame
+
+    def summary(self):
+        return {"on_time": self.on_time, "late": self.late, "dropped": self.dropped}
+
+    def report(self):
+        return f"{self.on_time} frames on time, {self.late} late, {self.dropped} dropped"
\ No newline at end of file
@@ -0,0 +1,338 @@
+import os
+import time
+import functools
+import collections
+import multiprocessing
+import numpy as np
+
+UNICODE_BLOCK = "█"
+# the default shading characters, from light to dark
+SHADING = [" ", ".", ":", "=", "#"]
+COLOR_PREFIX = "\033[38;2;"
+# continues the foreground escape, so a half-block cell still has a single escape
+BACKGROUND_PREFIX = "48;2;"
+
+# pixels per cell (columns, rows) for every way of drawing a cell
+ENCODINGS = {
+    "cell": (1, 1),
+    "halfblock": (1, 2),
+    "braille": (2, 4)
+}
+
+# the upper half is the foreground color and the lower half the background
+HALF_BLOCK = "▀"
+# without color a half is either lit or not, indexed by top * 2 + bottom
+HALF_BLOCKS = " ▄▀█"
+
+BRAILLE_BASE = 0x2800
+# bit of every dot in a 2x4 braille cell, by row and column
+BRAILLE_DOTS = [[0x01, 0x08], [0x02, 0x10], [0x04, 0x20], [0x40, 0x80]]
+
+# brightness from which a half block or braille dot is lit
+LIT_THRESHOLD = 128
+
+# upper bound (inclusive) of each of the 5 shading levels, same as the old if/elif ladder
+SHADE_LIMITS = [51, 102, 153, 204, 255]
+
+# widest color cell: ESC [ 3 8 ; 2 ; rrr ; ggg ; bbb m + character
+COLOR_CELL_WIDTH = len(COLOR_PREFIX) + 3 + 1 + 3 + 1 + 3 + 1 + 1
+
+def image_to_pixels(image, size):
+    image = image.resize(size)
+    image = image.convert("RGB")
+    return np.asarray(image, dtype=np.uint8)
+
+def pixel_size(size, encoding="cell"):
+    # how many pixels a grid of cells needs with this encoding
+    columns, rows = ENCODINGS[encoding]
+    return (size[0] * columns, size[1] * rows)
+
+def box_edges(source, target):
+    edges = (np.arange(target) * source) // target
+    counts = np.diff(np.append(edges, source))
+    # enlarging repeats source pixels, reduceat then returns the single pixel
+    return edges, np.maximum(counts, 1)
+
+def resize_pixels(pixels, size):
+    # box filter when shrinking and nearest neighbour when enlarging, without PIL
+    width, height = size
+    if pixels.shape[1] == width and pixels.shape[0] == height:
+        return pixels
+
+    rows, row_counts = box_edges(pixels.shape[0], height)
+    columns, column_counts = box_edges(pixels.shape[1], width)
+
+    sums = np.add.reduceat(pixels.astype(np.uint32), rows, axis=0)
+    sums = np.add.reduceat(sums, columns, axis=1)
+
+    counts = np.outer(row_counts, column_counts)
+    if pixels.ndim == 3:
+        counts = counts[..., None]
+
+    return ((sums + counts // 2) // counts).astype(np.uint8)
+
+def brightness(pixels):
+    # flattened gray frames from ffmpeg already are the brightness
+    if pixels.ndim == 1:
+        return pixels
+
+    # same as int((r + g + b) / 3) for every 8-bit pixel
+    return (pixels.astype(np.uint16).sum(axis=-1) // 3).astype(np.uint8)
+
+def gray(pixels):
+    return pixels if pixels.ndim == 2 else brightness(pixels)
+
+def rgb(pixels):
+    return np.repeat(pixels[..., None], 3, axis=-1) if pixels.ndim == 2 else pixels
+
+@functools.lru_cache(maxsize=16)
+def shade_table(shading):
+    table = []
+
+    for value in range(256):
+        for level, limit in enumerate(SHADE_LIMITS):
+            if value <= limit:
+                table.append(shading[level])
+                break
+
+    return table
+
+@functools.lru_cache(maxsize=16)
+def codepoint_table(shading):
+    # only usable when every shading level is exactly one character
+    if any(len(char) != 1 for char in shading):
+        return None
+
+    return np.array([ord(char) for char in shade_table(shading)], dtype=np.uint32)
+
+@functools.lru_cache(maxsize=1)
+def digit_table():
+    # codepoints of the decimal form of 0-255, padded with zeros which get stripped later
+    digits = np.zeros((256, 3), dtype=np.uint32)
+
+    for value in range(256):
+        text = str(value)
+        digits[value, :len(text)] = [ord(char) for char in text]
+
+    return digits
+
+def codepoints_to_text(codepoints):
+    return np.ascontiguousarray(codepoints, dtype="<u4").tobytes().decode("utf-32-le")
+
+def flatten(pixels):
+    if pixels.ndim == 2:
+        return pixels.reshape(-1)
+    return pixels.reshape(-1, 3)
+
+def cell_codepoints(pixels, shading):
+    # one codepoint per pixel, or None if the shading characters need the slow path
+    flat = flatten(pixels)
+
+    if shading is None:
+        return np.full(len(flat), ord(UNICODE_BLOCK), dtype=np.uint32)
+
+    table = codepoint_table(tuple(shading))
+    if table is None:
+        return None
+
+    return table[brightness(flat)]
+
+def run_starts(flat, width, tolerance=0):
+    # a color run starts at every row and wherever the color leaves the previous cell's bucket,
+    # buckets are tolerance + 1 wide so every cell in a run is within tolerance of its first cell
+    keys = flat // (tolerance + 1) if tolerance else flat
+
+    starts = np.ones(len(flat), dtype=bool)
+    starts[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+    starts[::width] = True
+    return starts
+
+def color_codepoints(flat, cells, starts=None, background=None):
+    # background adds a background color to the same escape
+    digits = digit_table()
+    layers = [(COLOR_PREFIX, flat)]
+    width = COLOR_CELL_WIDTH
+
+    if background is not None:
+        layers.append((BACKGROUND_PREFIX, background))
+        width += len(BACKGROUND_PREFIX) + 12
+
+    out = np.zeros((len(flat), width), dtype=np.uint32)
+    column = 0
+
+    for prefix, colors in layers:
+        out[:, column:column + len(prefix)] = [ord(char) for char in prefix]
+        column += len(prefix)
+
+        for channel in range(3):
+            out[:, column:column + 3] = digits[colors[:, channel]]
+            out[:, column + 3] = ord(";")
+            column += 4
+
+    out[:, column - 1] = ord("m")
+    out[:, column] = cells
+
+    if starts is not None:
+        out[~starts, :column] = 0
+
+    return out[out != 0]
+
+def half_block_text(pixels, color=False, color_runs=False, tolerance=0):
+    # two rows of pixels per row of cells
+    rows = pixels.shape[0] // 2
+
+    if not color:
+        lit = gray(pixels[:rows * 2]) >= LIT_THRESHOLD
+        table = np.array([ord(char) for char in HALF_BLOCKS], dtype=np.uint32)
+        return codepoints_to_text(table[lit[0::2] * 2 + lit[1::2]])
+
+    pixels = rgb(pixels)
+    top = flatten(pixels[0:rows * 2:2])
+    bottom = flatten(pixels[1:rows * 2:2])
+    cells = np.full(len(top), ord(HALF_BLOCK), dtype=np.uint32)
+
+    # a run has to keep both colors
+    starts = run_starts(np.concatenate([top, bottom], axis=1), pixels.shape[1], tolerance) if color_runs else None
+    return codepoints_to_text(color_codepoints(top, cells, starts, bottom))
+
+def braille_text(pixels, color=False, color_runs=False, tolerance=0):
+    # 2x4 pixels per cell, every lit pixel is a dot and the color is the average of the cell
+    rows, columns = pixels.shape[0] // 4, pixels.shape[1] // 2
+    lit = gray(pixels[:rows * 4, :columns * 2]) >= LIT_THRESHOLD
+
+    dots = lit.reshape(rows, 4, columns, 2) * np.array(BRAILLE_DOTS, dtype=np.uint32)[None, :, None, :]
+    cells = BRAILLE_BASE + dots.sum(axis=(1, 3), dtype=np.uint32).reshape(-1)
+
+    if not color:
+        return codepoints_to_text(cells)
+
+    colors = flatten(resize_pixels(rgb(pixels[:rows * 4, :columns * 2]), (columns, rows)))
+    starts = run_starts(colors, columns, tolerance) if color_runs else None
+    return codepoints_to_text(color_codepoints(colors, cells, starts))
+
+def frame_to_text(pixels, shading=None, color=False, color_runs=False, tolerance=0, encoding="cell"):
+    # pixels is an (height, width, 3) uint8 array, or (height, width) for gray frames
+    # shading None means UNICODE_BLOCK everywhere
+    # color_runs only emits a color escape when the color changes along a row
+    # half blocks and braille pack several pixels into a cell and ignore the shading,
+    # the pixels then have to be pixel_size() of the cell grid
+    if encoding == "halfblock":
+        return half_block_text(pixels, color, color_runs, tolerance)
+    if encoding == "braille":
+        return braille_text(pixels, color, color_runs, tolerance)
+
+    if color and pixels.ndim == 2:
+        pixels = np.repeat(pixels[..., None], 3, axis=-1)
+
+    flat = flatten(pixels)
+    cells = cell_codepoints(pixels, shading)
+    starts = run_starts(flat, pixels.shape[1], tolerance) if color and color_runs else None
+
+    if cells is None:
+        return frame_to_text_slow(flat, shading, color, starts)
+
+    if color:
+        return codepoints_to_text(color_codepoints(flat, cells, starts))
+
+    return codepoints_to_text(cells)
+
+def frame_to_text_slow(flat, shading, color, starts=None):
+    table = shade_table(tuple(shading))
+    chars = [table[value] for value in brightness(flat).tolist()]
+
+    if color:
+        if starts is None:
+            starts = [True] * len(chars)
+        else:
+            starts = starts.tolist()
+
+        chars = [
+            f"{COLOR_PREFIX}{r};{g};{b}m{char}" if start else char
+            for (r, g, b), char, start in zip(flat.tolist(), chars, starts)
+        ]
+
+    return "".join(chars)
+
+def frame_to_text_loop(pixels, shading=None, color=False):
+    # the original per-pixel loop, kept as the reference for the benchmark
+    text_frame = ""
+
+    for r, g, b in pixels.reshape(-1, 3).tolist():
+        if shading is not None:
+            brightness = int((r + g + b) / 3)
+
+            if   brightness <= 51:  pixel = shading[0]
+            elif brightness <= 102: pixel = shading[1]
+            elif brightness <= 153: pixel = shading[2]
+            elif brightness <= 204: pixel = shading[3]
+            elif brightness <= 255: pixel = shading[4]
+            else:                   pixel = "?"
+
+        else:
+            pixel = UNICODE_BLOCK
+
+        if color: pixel = f"{COLOR_PREFIX}{r};{g};{b}m{pixel}"
+
+        text_frame += pixel
+
+    return text_frame
+
+def timed_frame_to_text(pixels, shading, color, options):
+    start = time.perf_counter()
+    text_frame = frame_to_text(pixels, shading, color, **options)
+    return text_frame, time.perf_counter() - start
+
+def convert_chunk(chunk, shading, color, options):
+    # every frame comes back with how long it took to convert
+    return [timed_frame_to_text(pixels, shading, color, options) for pixels in chunk]
+
+def chunked(frames, size):
+    chunk = []
+
+    for pixels in frames:
+        chunk.append(pixels)
+
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+def resolve_workers(workers):
+    # 0 or less means one worker per core
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+def convert_frames(frames, shading=None, color=False, workers=1, chunk_size=16, timer=None, start_method=None, **options):
+    # yields frame text in the original order, with at most a few chunks in flight per worker
+    # timer is called with the seconds each frame took, options are passed on to frame_to_text
+    # start_method picks how the workers are started, the default one if None
+    workers = resolve_workers(workers)
+
+    if workers == 1:
+        for pixels in frames:
+            text_frame, seconds = timed_frame_to_text(pixels, shading, color, options)
+            if timer:
+                timer(seconds)
+            yield text_frame
+        return
+
+    with multiprocessing.get_context(start_method).Pool(workers) as pool:
+        pending = collections.deque()
+
+        def finished():
+            for text_frame, seconds in pending.popleft().get():
+                if timer:
+                    timer(seconds)
+                yield text_frame
+
+        for chunk in chunked(frames, chunk_size):
+            pending.append(pool.apply_async(convert_chunk, (chunk, shading, color, options)))
+
+            if len(pending) >= workers * 2:
+                yield from finished()
+
+        while pending:
+            yield from finished()
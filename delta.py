@@ -0,0 +1,96 @@
+import re
+
+from sequence import SequenceWriter
+
+CELL_PATTERN = re.compile(r"((?:\033\[[0-9;]*m)*)(.)", re.S)
+
+# repositioning the cursor costs about this many bytes, so shorter unchanged gaps are just redrawn
+GAP_LIMIT = 6
+
+DELTA_FILE = "delta.bin"
+
+def split_cells(frame):
+    # every cell becomes (sgr, char), where sgr is whatever escape is in effect for it
+    if "\033" not in frame:
+        return [("", char) for char in frame]
+
+    cells = []
+    sgr = ""
+
+    for escape, char in CELL_PATTERN.findall(frame):
+        if escape:
+            sgr = escape
+        cells.append((sgr, char))
+
+    return cells
+
+def changed_runs(previous, row):
+    runs = []
+    start = None
+    gap = 0
+
+    for column, cell in enumerate(row):
+        if previous is not None and previous[column] == cell:
+            gap += 1
+            continue
+
+        if start is None or gap > GAP_LIMIT:
+            if start is not None:
+                runs.append((start, end))
+            start = column
+
+        end = column + 1
+        gap = 0
+
+    if start is not None:
+        runs.append((start, end))
+
+    return runs
+
+def frame_delta(previous, cells, width):
+    out = []
+    sgr = None
+
+    for top in range(0, len(cells), width):
+        row = cells[top:top + width]
+        previous_row = previous[top:top + width] if previous is not None and len(previous) == len(cells) else None
+
+        if previous_row == row:
+            continue
+
+        for start, end in changed_runs(previous_row, row):
+            out.append(f"\033[{top // width + 1};{start + 1}H")
+
+            for cell_sgr, char in row[start:end]:
+                if cell_sgr != sgr:
+                    out.append(cell_sgr)
+                    sgr = cell_sgr
+                out.append(char)
+
+    return "".join(out)
+
+def delta_frames(frames, width):
+    # yields the escape sequence that turns the previous frame into the next one
+    previous = None
+    previous_frame = None
+
+    for frame in frames:
+        # a repeated frame changes nothing, no need to split it up
+        if frame == previous_frame:
+            yield ""
+            continue
+
+        cells = split_cells(frame)
+        yield frame_delta(previous, cells, width)
+        previous = cells
+        previous_frame = frame
+
+def write_deltas(frames, delta_file, terminal_size, framerate):
+    count = 0
+
+    with SequenceWriter(delta_file, terminal_size, framerate, {"delta": True}) as writer:
+        for delta in delta_frames(frames, terminal_size[0]):
+            writer.write(delta)
+            count += 1
+
+    return count
\ No newline at end of file
@@ -0,0 +1,73 @@
+import os
+import math
+import numpy as np
+
+from convert import image_to_pixels
+
+FRAMES_DIR = "frames"
+FRAME_PATTERN = "frames/frame_%06d.png"
+
+# ffmpeg and PIL are imported where they are used, so playing a saved render never loads them
+
+def estimate_frame_count(video_file, framerate):
+    import ffmpeg
+
+    try:
+        duration = float(ffmpeg.probe(video_file)["format"]["duration"])
+    except:
+        return None
+
+    return math.ceil(duration * framerate)
+
+def stream_frames(video_file, framerate, size, gray=False, quiet=False):
+    # ffmpeg does the fps filter and scaling, and hands over raw frames on stdout
+    import ffmpeg
+
+    width, height = size
+    channels = 1 if gray else 3
+    frame_bytes = width * height * channels
+
+    stream = ffmpeg.input(video_file)
+    stream = stream.filter("fps", fps=str(framerate))
+    stream = stream.filter("scale", width, height)
+    stream = stream.output("pipe:", format="rawvideo", pix_fmt="gray" if gray else "rgb24", loglevel="quiet" if quiet else "error")
+
+    process = stream.run_async(pipe_stdout=True)
+
+    try:
+        while True:
+            buffer = process.stdout.read(frame_bytes)
+            if len(buffer) < frame_bytes:
+                break
+
+            pixels = np.frombuffer(buffer, dtype=np.uint8)
+            yield pixels.reshape(height, width) if gray else pixels.reshape(height, width, 3)
+
+    finally:
+        process.stdout.close()
+        process.wait()
+
+    # only a stream read to the end says whether ffmpeg failed, one closed early kills it with a broken pipe
+    if process.returncode != 0:
+        raise ffmpeg.Error("ffmpeg", None, None)
+
+def extract_png_frames(video_file, framerate, quiet=False):
+    import ffmpeg
+
+    stream = ffmpeg.input(video_file)
+    stream = stream.filter("fps", fps=str(framerate))
+    stream = stream.output(FRAME_PATTERN, loglevel="quiet") if quiet else stream.output(FRAME_PATTERN)
+    stream.run()
+
+def png_frames(size, directory=FRAMES_DIR):
+    from PIL import Image
+
+    frame_files = os.listdir(directory)
+    frame_files.sort()
+
+    for frame in frame_files:
+        image = Image.open(os.path.join(directory, frame))
+        yield image_to_pixels(image, size)
+
+def count_png_frames(directory=FRAMES_DIR):
+    return len(os.listdir(directory))
\ No newline at end of file
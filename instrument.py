@@ -0,0 +1,121 @@
+import os
+import json
+import time
+
+STATS_FILE = "stats.json"
+
+# histogram bucket upper bounds in milliseconds, the last bucket takes everything above
+BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128]
+
+def cpu_times():
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def histogram(seconds):
+    counts = [0] * (len(BUCKETS) + 1)
+
+    for value in seconds:
+        milliseconds = value * 1000
+        for bucket, limit in enumerate(BUCKETS):
+            if milliseconds <= limit:
+                counts[bucket] += 1
+                break
+        else:
+            counts[-1] += 1
+
+    labels = [f"<={limit}ms" for limit in BUCKETS] + [f">{BUCKETS[-1]}ms"]
+    return dict(zip(labels, counts))
+
+def summarize(seconds):
+    if not seconds:
+        return {"count": 0}
+
+    ordered = sorted(seconds)
+    return {
+        "count": len(ordered),
+        "total_s": round(sum(ordered), 6),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "histogram": histogram(ordered)
+    }
+
+class Instrumentation:
+    # does nothing unless enabled, so it can be called from every stage unconditionally
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+        self.running = {}
+        self.series = {}
+        self.counts = {}
+        self.values = {}
+
+    def begin(self, stage):
+        if self.enabled:
+            self.running[stage] = (time.perf_counter(), *cpu_times())
+
+    def end(self, stage):
+        if not self.enabled or stage not in self.running:
+            return
+
+        wall, cpu, children = self.running.pop(stage)
+        now_cpu, now_children = cpu_times()
+
+        self.stages[stage] = {
+            "wall_s": round(time.perf_counter() - wall, 6),
+            "cpu_s": round(now_cpu - cpu, 6),
+            # ffmpeg and pool workers only show up here once they have exited
+            "children_cpu_s": round(now_children - children, 6)
+        }
+
+    def sample(self, series, seconds):
+        if self.enabled:
+            self.series.setdefault(series, []).append(seconds)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def set(self, name, value):
+        if self.enabled:
+            self.values[name] = value
+
+    def report(self):
+        for stage in list(self.running):
+            self.end(stage)
+
+        return {
+            "stages": self.stages,
+            "series": {name: summarize(values) for name, values in self.series.items()},
+            "counts": self.counts,
+            **self.values
+        }
+
+    def dump(self, directory, section):
+        # generate and playback keep their own section of the same file
+        if not self.enabled:
+            return None
+
+        path = os.path.join(directory, STATS_FILE)
+        stats = {}
+
+        if os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    stats = json.load(f)
+            except:
+                pass
+
+        stats[section] = self.report()
+        stats[section]["time"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+        with open(path, "w") as f:
+            json.dump(stats, f, indent=4)
+
+        return path
\ No newline at end of file
@@ -1,12 +1,25 @@
 import os
+import sys
 import shutil
-from yt_dlp import YoutubeDL
-import ffmpeg
-from PIL import Image
 import multiprocessing
-from playsound import playsound
-import time
 import json
+import time
+
+from convert import UNICODE_BLOCK, SHADING, ENCODINGS, pixel_size, convert_frames, resolve_workers
+from delta import DELTA_FILE, delta_frames, write_deltas
+from sequence import COMPRESSIONS, SequenceWriter, SequenceReader, TextSequence, has_sequence, open_sequence, read_info, store_sequence
+from clock import FrameScheduler
+from pipeline import Pipeline
+from rerender import MASTER_SIZE, RENDITIONS_DIR, decode_size, master_writer, record_master, matches, rendition, Renditions
+from instrument import STATS_FILE, Instrumentation
+from output import FrameOutput
+from player import SEEK_SECONDS, KEYS_HELP, Player
+from audio import SINKS, AudioClock, decode_pcm, make_sink
+from prefetch import BUFFER_MB, PrefetchBuffer
+from quality import QualityGovernor, calibrate
+from manifest import Manifest
+from render_cache import source_id, render_key, find_render, load_render, cache_render
+from frames import stream_frames, estimate_frame_count, extract_png_frames, png_frames, count_png_frames
 
 OPTION_INVALID = "Invalid option. Try again."
 CAN_CANCEL = "You can leave the field blank to keep the setting unchanged."
@@ -14,13 +27,14 @@ CANCEL = "Change operation canceled."
 ERROR_FFMPEG = "[ERROR] ffmpeg has given an error, exiting"
 
 COLOR_RESET = "\033[0m"
-UNICODE_BLOCK = "\u2588"
 CLEAR_COMMAND = "cls" if os.name == "nt" else "clear"
 
 CONFIG_FILE = "config2.json"
 VIDEO_FILE = "assets/video.webm"
 AUDIO_FILE = "assets/audio.mp3"
 ASCII_FILE = "assets/ascii.txt"
+SEQUENCE_FILE = "assets/sequence.bin"
+MASTER_FILE = "assets/master.bin"
 INFOS_FILE = "assets/info.json"
 
 BAD_APPLE_URL = "https://www.youtube.com/watch?v=FtutLA63Cp8"
@@ -29,10 +43,30 @@ DEFAULT_CONFIG = {
     "default_path": BAD_APPLE_URL,
     "framerate": 30,
     "shade": True,
-    "shading": [" ", ".", ":", "=", "#"],
+    "shading": list(SHADING),
     "color": False,
     "quiet": False,
-    "delete_frames": False
+    "delete_frames": False,
+    "stream_frames": True,
+    "workers": 0,
+    "delta_playback": True,
+    "precompute_deltas": False,
+    "color_tolerance": 0,
+    "compression": "zlib",
+    "drop_frames": True,
+    "ahead_mode": "hold",
+    "play_while_generating": False,
+    "store_master": True,
+    "render_cache_mb": 1024,
+    "instrument": False,
+    "cell_encoding": "cell",
+    "generate_cache_mb": 4096,
+    "synchronized_output": True,
+    "interactive_player": True,
+    "seek_seconds": SEEK_SECONDS,
+    "audio_output": "auto",
+    "playback_buffer_mb": BUFFER_MB,
+    "adaptive_quality": True
 }
 
 def custom_output(stream, output_name):
@@ -86,141 +120,298 @@ def whitespace():
         print()
 
 def generate():
+    # the download and video backends are slow to import, so only generating loads them
+    import ffmpeg
+
     print(f"Please enter a video URL or local path, or leave blank for fallback '{config['default_path']}'")
     path = input("Path/URL: ")
 
     if not path: 
         path = config["default_path"]
 
-    if os.path.isdir("assets"):
-        shutil.rmtree("assets")
-    os.mkdir("assets")
+    terminal_size_obj = os.get_terminal_size()
+    terminal_size = [terminal_size_obj.columns, terminal_size_obj.lines]
+    key = None
 
-    if "http://" in path or "https://" in path:
-        print("[1/4] Downloading video...")
-        
-        opts = {"outtmpl": VIDEO_FILE}
-        if config["quiet"]:
-            opts["quiet"] = True
+    # a missing local file is reported by the download step below
+    source = source_id(path) if "http://" in path or "https://" in path or os.path.isfile(path) else None
 
-        try:
-            YoutubeDL(opts).download(path)
-        
-        except:
-            print("[ERROR] yt-dlp has given an error, exiting")
+    if config["generate_cache_mb"] > 0 and source:
+        key = render_key(source, config["framerate"], terminal_size, config["shade"], config["shading"], config["color"], config["color_tolerance"], config["cell_encoding"])
+        cached = find_render(key)
+
+        if cached:
+            # only the render files are swapped, the manifest and the downloaded video stay for the next run to reuse
+            load_render(cached, "assets")
+
+            print(f"This video was already generated with these settings, loaded it from '{cached}'")
+            print("Exiting to menu, make sure to save your video with option 3 if you want to!")
             return
-    
+
+    os.makedirs("assets", exist_ok=True)
+
+    # stages are only run again if what they are made from has changed since the last run
+    manifest = Manifest("assets")
+    stats = Instrumentation(config["instrument"])
+
+    download_inputs = {"source": source}
+
+    if source and manifest.fresh("download", download_inputs):
+        print("[1/4] The video has not changed, reusing it")
+
     else:
-        print("[1/4] Converting video...")
+        stats.begin("download")
+        start = time.perf_counter()
+
+        if os.path.isfile(VIDEO_FILE):
+            os.remove(VIDEO_FILE)
 
-        if not os.path.isfile(path):
-            print(f"[ERROR] There is no file at '{path}'")
+        if "http://" in path or "https://" in path:
+            print("[1/4] Downloading video...")
+            
+            opts = {"outtmpl": VIDEO_FILE}
+            if config["quiet"]:
+                opts["quiet"] = True
+
+            try:
+                from yt_dlp import YoutubeDL
+                YoutubeDL(opts).download(path)
+            
+            except:
+                print("[ERROR] yt-dlp has given an error, exiting")
+                return
+        
+        else:
+            print("[1/4] Converting video...")
+
+            if not os.path.isfile(path):
+                print(f"[ERROR] There is no file at '{path}'")
+                return
+
+            try:
+                stream = ffmpeg.input(path)
+                stream = custom_output(stream, VIDEO_FILE)
+                stream.run()
+            
+            except:
+                print(ERROR_FFMPEG)
+                return
+
+        if not os.path.isfile(VIDEO_FILE):
+            print(f"[ERROR] The video has seemed to have disappeared?!")
             return
 
+        manifest.record("download", download_inputs, [VIDEO_FILE], time.perf_counter() - start)
+        stats.end("download")
+
+    whitespace()
+
+    video = manifest.output("download", VIDEO_FILE)
+    audio_inputs = {"video": video}
+
+    if manifest.fresh("audio", audio_inputs):
+        print("[2/4] The audio has not changed, reusing it")
+
+    else:
+        print("[2/4] Extracting audio from video...")
+        stats.begin("audio")
+        start = time.perf_counter()
+
+        if os.path.isfile(AUDIO_FILE):
+            os.remove(AUDIO_FILE)
+
         try:
-            stream = ffmpeg.input(path)
-            stream = custom_output(stream, VIDEO_FILE)
+            stream = ffmpeg.input(VIDEO_FILE)
+            stream = custom_output(stream, AUDIO_FILE)
             stream.run()
-        
+
         except:
             print(ERROR_FFMPEG)
             return
 
-    if not os.path.isfile(VIDEO_FILE):
-        print(f"[ERROR] The video has seemed to have disappeared?!")
-        return
+        manifest.record("audio", audio_inputs, [AUDIO_FILE], time.perf_counter() - start)
+        stats.end("audio")
 
     whitespace()
 
-    print("[2/4] Extracting audio from video...")
+    infos = {
+        "framerate": config["framerate"],
+        "terminal_size": terminal_size,
+        "color": config["color"]
+    }
+
+    infos["shading"] = config["shading"] if config["shade"] else UNICODE_BLOCK
+    infos["cell_encoding"] = config["cell_encoding"]
 
-    if os.path.isfile(AUDIO_FILE):
-        os.path.remove(AUDIO_FILE)
+    if config["color"]:
+        infos["color_encoding"] = "runs"
+        infos["color_tolerance"] = config["color_tolerance"]
 
-    try:
-        stream = ffmpeg.input(VIDEO_FILE)
-        stream = custom_output(stream, AUDIO_FILE)
-        stream.run()
+    if key:
+        infos["render_key"] = key
 
-    except:
-        print(ERROR_FFMPEG)
-        return
+    ascii_inputs = {
+        "video": video,
+        "framerate": config["framerate"],
+        "terminal_size": terminal_size,
+        "shade": config["shade"],
+        "shading": config["shading"],
+        "color": config["color"],
+        "color_tolerance": config["color_tolerance"],
+        "cell_encoding": config["cell_encoding"],
+        "store_master": config["store_master"]
+    }
+    ascii_outputs = [SEQUENCE_FILE, MASTER_FILE] if config["store_master"] else [SEQUENCE_FILE]
+    complete = True
 
-    whitespace()
+    if manifest.fresh("ascii", ascii_inputs):
+        print("[3/4] Frames are not needed, the ASCII art has not changed")
+        whitespace()
+        print("[4/4] The ASCII art has not changed, reusing it")
 
-    print("[3/4] Extracting frames from video (this may take longer)...")
+    else:
+        # anything left from the last run would not match the new ASCII
+        for filename in [ASCII_FILE, SEQUENCE_FILE, MASTER_FILE, os.path.join("assets", DELTA_FILE)]:
+            if os.path.isfile(filename):
+                os.remove(filename)
 
-    if os.path.isdir("frames"):
-        shutil.rmtree("frames")
-    os.mkdir("frames")
+        manifest.invalidate("ascii")
+        start = time.perf_counter()
 
-    try:
-        stream = ffmpeg.input(VIDEO_FILE)
-        stream = stream.filter("fps", fps=str(config["framerate"]))
-        stream = custom_output(stream, "frames/frame_%06d.png")
-        stream.run()
+        # half blocks and braille need several pixels for every cell
+        frame_size = pixel_size((terminal_size[0], terminal_size[1] - 1), config["cell_encoding"])
 
-    except:
-        print(ERROR_FFMPEG)
-        return
+        # with a master copy, frames are decoded big enough for it and for this render, each is scaled from the decoded frame
+        source_size = decode_size(frame_size) if config["store_master"] else frame_size
 
-    whitespace()
+        # when streaming, decoding happens during the ascii stage and this one is only the setup
+        stats.begin("frames")
+        stats.set("streamed_frames", config["stream_frames"])
 
-    terminal_size_obj = os.get_terminal_size()
-    terminal_size = [terminal_size_obj.columns, terminal_size_obj.lines]
+        if config["stream_frames"]:
+            print("[3/4] Streaming frames from ffmpeg, no frames directory needed")
 
-    print(f"[4/4] Generating ASCII art from frames... ({terminal_size[0]}x{terminal_size[1]})")
+            # a gray pipe is a third of the size and all that shading needs
+            frames = stream_frames(VIDEO_FILE, config["framerate"], source_size, gray=not (config["color"] or config["store_master"]), quiet=config["quiet"])
+            frame_count = estimate_frame_count(VIDEO_FILE, config["framerate"])
 
-    text_frames = []
-    frame_files = os.listdir("frames")
-    frame_files.sort()
-    count = 0
+        else:
+            frames_inputs = {"video": video, "framerate": config["framerate"]}
 
-    for frame in frame_files:
-        path = os.path.join("frames", frame)
+            if manifest.fresh("frames", frames_inputs):
+                print("[3/4] The frames have not changed, reusing them")
 
-        image = Image.open(path)
-        image = image.resize((terminal_size[0], terminal_size[1] - 1))
-        image = image.convert("RGB")
-        
-        text_frame = ""
+            else:
+                print("[3/4] Extracting frames from video (this may take longer)...")
+                frames_start = time.perf_counter()
 
-        for pixel_rgb in list(image.getdata()):
-            r = pixel_rgb[0]
-            g = pixel_rgb[1]
-            b = pixel_rgb[2]
+                if os.path.isdir("frames"):
+                    shutil.rmtree("frames")
+                os.mkdir("frames")
 
-            if config["shade"]:
-                brightness = int((r + g + b) / 3)
+                try:
+                    extract_png_frames(VIDEO_FILE, config["framerate"], config["quiet"])
 
-                if   brightness <= 51:  pixel = config["shading"][0]
-                elif brightness <= 102: pixel = config["shading"][1]
-                elif brightness <= 153: pixel = config["shading"][2]
-                elif brightness <= 204: pixel = config["shading"][3]
-                elif brightness <= 255: pixel = config["shading"][4]
-                else:                   pixel = "?"
+                except:
+                    print(ERROR_FFMPEG)
+                    return
 
-            else:
-                pixel = UNICODE_BLOCK
+                manifest.record("frames", frames_inputs, ["frames"], time.perf_counter() - frames_start)
 
-            if config["color"]: pixel = f"\033[38;2;{r};{g};{b}m{pixel}"
+            frames = png_frames(source_size)
+            frame_count = count_png_frames()
 
-            text_frame += pixel
+        if config["store_master"]:
+            master = master_writer(MASTER_FILE, config["framerate"], {"framerate": config["framerate"]})
+            frames = record_master(frames, master, frame_size)
 
-        text_frames.append(text_frame)
-        count += 1
+        stats.end("frames")
+        whitespace()
 
-        if not config["quiet"] and (count % 100 == 0 or count == len(frame_files)):
-            print(f"Processed {count} frames, {round(count / len(frame_files) * 100, 2)}% complete")
+        print(f"[4/4] Generating ASCII art from frames... ({terminal_size[0]}x{terminal_size[1]}, {resolve_workers(config['workers'])} workers)")
 
-    if os.path.isfile(ASCII_FILE):
-        os.remove(ASCII_FILE)
+        shading = config["shading"] if config["shade"] else None
+        count = 0
 
-    with open(ASCII_FILE, "a") as f:
-        for frame in text_frames:
-            f.write(frame + "\n")
+        stats.begin("ascii")
+        stats.set("terminal_size", terminal_size)
+        stats.set("workers", resolve_workers(config["workers"]))
+        timer = (lambda seconds: stats.sample("frame_conversion", seconds)) if stats.enabled else None
+
+        def convert(frames, start_method=None):
+            return convert_frames(frames, shading, config["color"], config["workers"], timer=timer, start_method=start_method, color_runs=True, tolerance=config["color_tolerance"], encoding=config["cell_encoding"])
+
+        try:
+            with SequenceWriter(SEQUENCE_FILE, terminal_size, config["framerate"], infos) as writer:
+                if config["play_while_generating"]:
+                    # the pool is made on the pipeline's thread while decoding and playback run, forking there could leave a worker stuck on a lock
+                    pipeline = Pipeline(frames, lambda frames: convert(frames, "spawn"), writer, config["framerate"], frame_count)
+                    pipeline.start()
+
+                    print("Buffering frames, playback starts as soon as conversion can keep up...")
+                    pipeline.wait_until_ready()
+
+                    playback(pipeline, config["framerate"], terminal_size[0], terminal_size[1], AUDIO_FILE, stats=stats)
+                    count = pipeline.produced
+                    # stopping playback early leaves a partial render, which must not be cached or reused
+                    complete = not pipeline.stop.is_set()
+
+                else:
+                    for text_frame in convert(frames):
+                        writer.write(text_frame)
+                        count += 1
+
+                        if not config["quiet"] and count % 100 == 0:
+                            if frame_count:
+                                print(f"Processed {count} frames, {round(min(count / frame_count, 1) * 100, 2)}% complete")
+                            else:
+                                print(f"Processed {count} frames")
+
+        except ffmpeg.Error:
+            print(ERROR_FFMPEG)
+            return
+
+        finally:
+            if config["store_master"]:
+                master.close()
+
+        stats.end("ascii")
+        stats.count("frames", count)
+
+        if complete:
+            manifest.record("ascii", ascii_inputs, ascii_outputs, time.perf_counter() - start)
+
+        repeated, saved = writer.savings()
+        stats.set("repeated_frames", repeated)
+
+        if not config["quiet"]:
+            print(f"Processed {count} frames, 100.0% complete")
+
+        print(f"{repeated} of {count} frames repeat an earlier one and were stored once, saving {saved / 2**20:.1f} MiB")
+
+    if config["precompute_deltas"]:
+        deltas_inputs = {"sequence": manifest.checksum(SEQUENCE_FILE)}
+
+        if manifest.fresh("deltas", deltas_inputs):
+            print("The frame deltas have not changed, reusing them")
+
+        else:
+            print("Precomputing frame deltas...")
+            stats.begin("deltas")
+            start = time.perf_counter()
 
-    if config["delete_frames"]:
+            with SequenceReader(SEQUENCE_FILE) as sequence:
+                write_deltas(sequence, os.path.join("assets", DELTA_FILE), terminal_size, config["framerate"])
+
+            manifest.record("deltas", deltas_inputs, [os.path.join("assets", DELTA_FILE)], time.perf_counter() - start)
+            stats.end("deltas")
+
+    else:
+        if os.path.isfile(os.path.join("assets", DELTA_FILE)):
+            os.remove(os.path.join("assets", DELTA_FILE))
+        manifest.invalidate("deltas")
+
+    if config["delete_frames"] and not config["stream_frames"]:
         try:
             shutil.rmtree("frames")
         except:
@@ -231,20 +422,123 @@ def generate():
     if os.path.isfile(INFOS_FILE):
         os.remove(INFOS_FILE)
 
-    infos = {
-        "framerate": config["framerate"],
-        "terminal_size": terminal_size,
-        "color": config["color"]
-    }
-
-    infos["shading"] = config["shading"] if config["shade"] else UNICODE_BLOCK
-
     with open(INFOS_FILE, "w") as f:
         json.dump(infos, f, indent=4)
 
+    if stats.dump("assets", "generate"):
+        print(f"Timing information has been saved to assets/{STATS_FILE}")
+
+    if key and complete:
+        cache_render("assets", key, config["generate_cache_mb"] * 2**20)
+
+    print(manifest.report())
     print("Your video has been generated!")
     print("Exiting to menu, make sure to save your video with option 3 if you want to!")
 
+def quality_governor(framerate, width, height):
+    # None when adaptive quality is turned off, or when the output is not a terminal there is nothing to measure
+    if not config["adaptive_quality"] or not os.isatty(sys.stdout.fileno()):
+        return None
+
+    print("Measuring how fast this terminal can draw...")
+    sys.stdout.flush()
+    return QualityGovernor(calibrate(sys.stdout.fileno(), (width, height)), framerate, config["shading"])
+
+def decode_audio(audio_file, fallback):
+    # the samples for an AudioClock, or None when the audio is played by playsound or ffplay instead
+    if not audio_file or config["audio_output"] == "playsound":
+        return None
+
+    samples = decode_pcm(audio_file)
+
+    if samples is None:
+        print(f"Could not decode the audio with ffmpeg, using {fallback}")
+
+    return samples
+
+def playback(text_frames, framerate, width, height, audio_file=None, precomputed_deltas=False, stats=None):
+    # with the audio decoded up front, frames follow how much of it has been played
+    audio = None
+    samples = decode_audio(audio_file, "playsound")
+
+    if samples is not None:
+        audio = AudioClock(samples, make_sink(config["audio_output"]))
+
+    # precomputed deltas each build on the one before, so none of them can be dropped
+    scheduler = FrameScheduler(framerate, config["drop_frames"] and not precomputed_deltas, config["ahead_mode"], clock=audio.position if audio else time.monotonic)
+    use_delta = precomputed_deltas or config["delta_playback"]
+
+    if isinstance(text_frames, (SequenceReader, TextSequence)) and (precomputed_deltas or not use_delta):
+        # the stored bytes go to the terminal as they are, without decoding them first
+        text_frames = text_frames.frames_from(0)
+
+    # only the frames in the buffer are ever in memory, however long the video is
+    buffer = PrefetchBuffer(text_frames, config["playback_buffer_mb"] * 2**20)
+    numbered = scheduler.numbered(buffer)
+
+    # precomputed deltas each build on the one before, so they can only be drawn as they are
+    # frames are left out by their number in the video, the scheduler's drops do not shift which ones
+    quality = quality_governor(framerate, width, height) if not precomputed_deltas else None
+    text_frames = quality.adapted(numbered) if quality else (frame for _, frame in numbered)
+
+    if use_delta and not precomputed_deltas:
+        text_frames = delta_frames(text_frames, width)
+
+    stats = stats or Instrumentation()
+    stats.begin("playback")
+
+    os.system(CLEAR_COMMAND)
+
+    if audio:
+        audio.start()
+
+    elif audio_file:
+        from playsound import playsound
+        audio_playback = multiprocessing.Process(target=playsound, args=(audio_file,), daemon=True)
+        audio_playback.start()
+
+    previous = None
+
+    # deltas move the cursor themselves, full frames are drawn from the top left corner
+    with FrameOutput(synchronized=config["synchronized_output"], home=not use_delta) as output:
+        for frame in text_frames:
+            # repeated frames leave the screen as it is, and an empty delta has nothing to draw
+            if (not frame) if use_delta else (frame == previous):
+                stats.count("repeated_frames")
+                if quality:
+                    quality.wrote(0)
+                continue
+
+            previous = frame
+            start = time.perf_counter()
+            size = output.write(frame)
+            stats.sample("frame_write", time.perf_counter() - start)
+
+            if quality:
+                quality.wrote(size)
+
+    if audio:
+        audio.stop()
+
+    elif audio_file and audio_playback.is_alive():
+        audio_playback.terminate()
+
+    sys.stdout.write(f"\033[{height};1H")
+
+    if config["color"]: print("\033[0m")
+
+    print(f"\nPlayback: {scheduler.report()}")
+    print(f"Buffer: {buffer.report()}")
+
+    if quality:
+        print(f"Quality: {quality.report()}")
+        stats.set("quality", quality.summary())
+
+    stats.end("playback")
+    stats.set("scheduler", scheduler.summary())
+    stats.set("buffer", buffer.summary())
+    stats.set("delta_playback", use_delta)
+
 def play():
     print("Please enter the name of a stored sequence or leave blank for the currently loaded one.")
     load = input("Name: ")
@@ -258,11 +552,11 @@ def play():
         print("Saved sequence not found, exiting")
         return
 
-    ascii_file = os.path.join(directory, "ascii.txt")
     audio_file = os.path.join(directory, "audio.mp3")
     infos_file = os.path.join(directory, "info.json")
+    master_file = os.path.join(directory, "master.bin")
 
-    if not os.path.isfile(ascii_file):
+    if not has_sequence(directory) and not os.path.isfile(master_file):
         print("You need at least a text file! exiting")
         return
 
@@ -272,40 +566,123 @@ def play():
         print("No audio file found, this will be bland methinks...")
         play_audio = False
 
-    if os.path.isfile(infos_file):
-        with open(infos_file, "r") as f:
-            data = json.load(f)
+    data = None
+    renditions = None
+
+    if os.path.isfile(master_file):
+        size = [*os.get_terminal_size()]
+        shading = config["shading"] if config["shade"] else None
+
+        if has_sequence(directory) and matches(read_info(directory), size, shading, config["color"], config["color_tolerance"], config["cell_encoding"]):
+            print(f"Found a master copy, the saved sequence already fits this terminal ({size[0]}x{size[1]})")
+            sequence = open_sequence(directory)
+            data = read_info(directory)
+
+        else:
+            print(f"Found a master copy, rendering it for this terminal ({size[0]}x{size[1]})...")
 
-        print(f"Found info: {data['framerate']} FPS, {data['terminal_size'][0]}x{data['terminal_size'][1]}, color: {data['color']}, shading: {data['shading']}")
-        print("You will need to set your terminal size to the WxH value above for the playback to work properly.")
+            def progress(count, total):
+                if not config["quiet"]:
+                    print(f"Rendered {count} frames, {round(count / total * 100, 2)}% complete")
+
+            path, cached = rendition(master_file, size, shading, config["color"], config["color_tolerance"], config["workers"], config["render_cache_mb"] * 2**20, progress, config["cell_encoding"])
+
+            if cached:
+                print("Using the cached rendering for this size")
+
+            sequence = SequenceReader(path)
+            data = dict(sequence.info)
+
+        print(f"Playing: {data['framerate']} FPS, color: {data['color']}, shading: {data['shading']}, cells: {data.get('cell_encoding', 'cell')}")
+
+        # the interactive player renders other sizes from the master copy when the terminal is resized
+        if config["interactive_player"]:
+            renditions = Renditions(master_file, shading, config["color"], config["color_tolerance"], config["cell_encoding"], config["workers"], config["render_cache_mb"] * 2**20)
+            renditions.add(size, sequence)
 
     else:
-        print("No information file found, using default values")
-        data = {
-            "framerate": config["framerate"],
-        }
+        sequence = open_sequence(directory)
+
+        if os.path.isfile(infos_file):
+            with open(infos_file, "r") as f:
+                data = json.load(f)
+
+        elif sequence.info:
+            data = dict(sequence.info)
+
+        if data:
+            # renders from before color runs have an escape on every cell
+            if data["color"]:
+                data.setdefault("color_encoding", "cells")
+
+            print(f"Found info: {data['framerate']} FPS, {data['terminal_size'][0]}x{data['terminal_size'][1]}, color: {data['color']}, shading: {data['shading']}, cells: {data.get('cell_encoding', 'cell')}")
+
+            if data["color"]:
+                print(f"Color encoding: {data['color_encoding']}, tolerance: {data.get('color_tolerance', 0)}")
 
-    with open(ascii_file, "r") as f:
-        text_frames = f.read().splitlines()
+            print("You will need to set your terminal size to the WxH value above for the playback to work properly.")
+
+        else:
+            print("No information file found, using default values")
+            data = {
+                "framerate": config["framerate"],
+            }
+
+    if "terminal_size" in data:
+        width, height = data["terminal_size"]
+    else:
+        width, height = os.get_terminal_size()
+
+    delta_file = os.path.join(directory, DELTA_FILE)
+
+    # the interactive player works out deltas itself, since precomputed ones cannot be seeked
+    if os.path.isfile(delta_file) and not os.path.isfile(master_file) and not config["interactive_player"]:
+        print("Found precomputed deltas, only changed cells will be redrawn")
+        text_frames = SequenceReader(delta_file)
+    else:
+        text_frames = sequence
 
     if config["color"]: print("\033[0m")
 
+    if config["interactive_player"]:
+        print(f"Controls: {KEYS_HELP}")
+
     input("\n[READY] Playback is ready. Press enter to play." )
 
-    os.system(CLEAR_COMMAND)
+    stats = Instrumentation(config["instrument"])
 
-    if play_audio:
-        audio_playback = multiprocessing.Process(target=playsound, args=(audio_file,), daemon=True)
-        audio_playback.start()
+    if config["interactive_player"]:
+        quality = quality_governor(data["framerate"], width, height)
+        # the player follows the audio as it plays, ffplay or playsound only come in without decoded samples
+        samples = decode_audio(audio_file if play_audio else None, "ffplay or playsound")
+        sink = make_sink(config["audio_output"]) if samples is not None else None
 
-    for frame in text_frames:
-        print(frame)
-        time.sleep(1 / data["framerate"])
+        player = Player(sequence, data["framerate"], width, height, audio_file if play_audio else None, config["delta_playback"], config["synchronized_output"], config["seek_seconds"], stats, renditions, quality, samples, sink, config["playback_buffer_mb"] * 2**20)
 
-    if play_audio and audio_playback.is_alive():
-        audio_playback.terminate()
+        os.system(CLEAR_COMMAND)
+        stats.begin("playback")
+        player.play()
+        stats.end("playback")
+        stats.set("player", player.summary())
 
-    if config["color"]: print("\033[0m")
+        print(f"Playback: {player.report()}")
+
+        if quality:
+            print(f"Quality: {quality.report()}")
+            stats.set("quality", quality.summary())
+
+    else:
+        playback(text_frames, data["framerate"], width, height, audio_file if play_audio else None, text_frames is not sequence, stats)
+
+    if stats.dump(directory, "playback"):
+        print(f"Timing information has been saved to {os.path.join(directory, STATS_FILE)}")
+
+    if renditions:
+        renditions.close()
+
+    for reader in [sequence, text_frames]:
+        if isinstance(reader, (SequenceReader, TextSequence)):
+            reader.close()
 
     input("\nThanks for watching! Press enter to return to the main menu.")
 
@@ -315,7 +692,7 @@ def save():
     if not os.path.isdir("stored"):
         os.mkdir("stored")
 
-    if not os.path.isfile(ASCII_FILE):
+    if not has_sequence("assets"):
         print("No ASCII file detected in main directory, cannot save this sequence")
         return
 
@@ -342,7 +719,8 @@ def save():
 
     os.mkdir(store_dir)
 
-    shutil.copy(ASCII_FILE, store_dir)
+    print(f"Writing the sequence ({config['compression']} compression)...")
+    store_sequence("assets", store_dir, config["compression"])
 
     try:
         shutil.copy(AUDIO_FILE, store_dir)
@@ -354,6 +732,16 @@ def save():
     except:
         pass
 
+    try:
+        shutil.copy(os.path.join("assets", DELTA_FILE), store_dir)
+    except:
+        pass
+
+    try:
+        shutil.copy(MASTER_FILE, store_dir)
+    except:
+        pass
+
     print(f"Stored your sequence as '{name}'")
 
 def edit_config(resume = None):
@@ -367,8 +755,26 @@ def edit_config(resume = None):
             f"Shading on/off: {config['shade']}",
             f"Shading levels: {config['shading']}",
             f"Use ANSI colors: {config['color']}",
+            f"Color tolerance: {config['color_tolerance']}",
             f"Quiet output: {config['quiet']}",
             f"Delete frames after: {config['delete_frames']}",
+            f"Stream frames from ffmpeg: {config['stream_frames']}",
+            f"Conversion workers: {config['workers']}",
+            f"Delta playback: {config['delta_playback']}",
+            f"Precompute deltas: {config['precompute_deltas']}",
+            f"Saved sequence compression: {config['compression']}",
+            f"Drop late frames: {config['drop_frames']}",
+            f"Play while generating: {config['play_while_generating']}",
+            f"Store master copy: {config['store_master']}",
+            f"Save timing information: {config['instrument']}",
+            f"Cell encoding: {config['cell_encoding']}",
+            f"Generated video cache size: {config['generate_cache_mb']} MB",
+            f"Synchronized output: {config['synchronized_output']}",
+            f"Interactive player: {config['interactive_player']}",
+            f"Seek step: {config['seek_seconds']} seconds",
+            f"Audio output: {config['audio_output']}",
+            f"Playback buffer: {config['playback_buffer_mb']} MB",
+            f"Adaptive quality: {config['adaptive_quality']}",
             "Reset All Settings",
             "Back"
         )
@@ -460,6 +866,25 @@ def edit_config(resume = None):
             print(f"Whether to use color codes has been set to {config['color']}")
 
     elif ch == 6:
+        print(f"The color tolerance is {config['color_tolerance']}. Color escapes are only written when the color changes along a row, and neighbouring colors within this distance (0-255 per channel) are merged into one run, which saves a lot of space.")
+        ch = input("New color tolerance: ")
+
+        if ch:
+            try:
+                config["color_tolerance"] = min(max(int(ch), 0), 255)
+
+            except:
+                print("The color tolerance provided must be an integer!")
+                edit_config(6)
+
+            else:
+                write_config()
+                print(f"Color tolerance has been set to {config['color_tolerance']}")
+
+        else:
+            print(CANCEL)
+
+    elif ch == 7:
         print(f"Quiet output is set to {config['quiet']}")
         ch = ask_boolean("Quiet?")
 
@@ -471,7 +896,7 @@ def edit_config(resume = None):
             write_config()
             print(f"Quiet output has been set to {config['quiet']}")
 
-    elif ch == 7:
+    elif ch == 8:
         print(f"Delete image frames after rendering (to save space) is set to {config['delete_frames']}")
         ch = ask_boolean("Delete frames?")
 
@@ -483,7 +908,251 @@ def edit_config(resume = None):
             write_config()
             print(f"Delete frames after has been set to {config['delete_frames']}")
 
-    elif ch == 8:
+    elif ch == 9:
+        print(f"Streaming frames is set to {config['stream_frames']}. ffmpeg scales the video and pipes raw frames straight to the converter, instead of writing PNGs to the frames directory (turn off to keep the PNGs for debugging)")
+        ch = ask_boolean("Stream frames?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["stream_frames"] = ch
+            write_config()
+            print(f"Streaming frames has been set to {config['stream_frames']}")
+
+    elif ch == 10:
+        print(f"ASCII conversion uses {config['workers']} worker processes. 0 means one per CPU core ({resolve_workers(0)} here).")
+        ch = input("New worker count: ")
+
+        if ch:
+            try:
+                config["workers"] = int(ch)
+
+            except:
+                print("The worker count provided must be an integer!")
+                edit_config(10)
+
+            else:
+                write_config()
+                print(f"Conversion workers has been set to {config['workers']}")
+
+        else:
+            print(CANCEL)
+
+    elif ch == 11:
+        print(f"Delta playback is set to {config['delta_playback']}. Only the cells that changed since the last frame are redrawn, instead of printing the whole frame.")
+        ch = ask_boolean("Use delta playback?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["delta_playback"] = ch
+            write_config()
+            print(f"Delta playback has been set to {config['delta_playback']}")
+
+    elif ch == 12:
+        print(f"Precompute deltas is set to {config['precompute_deltas']}. This saves the frame deltas to {DELTA_FILE} next to the ASCII when generating, so playback does not have to work them out.")
+        ch = ask_boolean("Precompute deltas?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["precompute_deltas"] = ch
+            write_config()
+            print(f"Precompute deltas has been set to {config['precompute_deltas']}")
+
+    elif ch == 13:
+        print(f"Saved sequences are compressed with {config['compression']}. Frames are compressed in small chunks, so playback can still jump anywhere. lzma is smaller but slower than zlib.")
+        ch = input(f"New compression ({', '.join(COMPRESSIONS)}): ").lower()
+
+        if not ch:
+            print(CANCEL)
+
+        elif ch in COMPRESSIONS:
+            config["compression"] = ch
+            write_config()
+            print(f"Saved sequence compression has been set to {config['compression']}")
+
+        else:
+            print(f"The compression must be one of {', '.join(COMPRESSIONS)}!")
+            edit_config(13)
+
+    elif ch == 14:
+        print(f"Dropping late frames is set to {config['drop_frames']}. When the terminal falls a whole frame behind, frames are skipped to catch up with the audio instead of playing everything late.")
+        ch = ask_boolean("Drop late frames?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["drop_frames"] = ch
+            write_config()
+            print(f"Dropping late frames has been set to {config['drop_frames']}")
+
+    elif ch == 15:
+        print(f"Playing while generating is set to {config['play_while_generating']}. Playback starts as soon as enough frames are converted to keep up, and the sequence is still saved as it plays.")
+        ch = ask_boolean("Play while generating?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["play_while_generating"] = ch
+            write_config()
+            print(f"Playing while generating has been set to {config['play_while_generating']}")
+
+    elif ch == 16:
+        print(f"Storing a master copy is set to {config['store_master']}. A {MASTER_SIZE[0]}x{MASTER_SIZE[1]} copy of the video is kept with the ASCII, so playback can render it again at any terminal size (renderings are cached in {RENDITIONS_DIR}, up to {config['render_cache_mb']} MB). Sizes that need more pixels than that, like braille wider than {MASTER_SIZE[0] // 2} columns, are enlarged from it.")
+        ch = ask_boolean("Store master copy?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["store_master"] = ch
+            write_config()
+            print(f"Storing a master copy has been set to {config['store_master']}")
+
+    elif ch == 17:
+        print(f"Saving timing information is set to {config['instrument']}. Generating and playing then write how long each stage and frame took to {STATS_FILE} next to info.json.")
+        ch = ask_boolean("Save timing information?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["instrument"] = ch
+            write_config()
+            print(f"Saving timing information has been set to {config['instrument']}")
+
+    elif ch == 18:
+        print(f"Cells are drawn as {config['cell_encoding']}. 'cell' is one pixel per character with the shading levels, 'halfblock' puts two pixels in every character (with color the top and bottom get their own color), and 'braille' draws 2x4 dots per character. Shading levels are not used by halfblock and braille.")
+        ch = input(f"New cell encoding ({', '.join(ENCODINGS)}): ").lower()
+
+        if not ch:
+            print(CANCEL)
+
+        elif ch in ENCODINGS:
+            config["cell_encoding"] = ch
+            write_config()
+            print(f"Cell encoding has been set to {config['cell_encoding']}")
+
+        else:
+            print(f"The cell encoding must be one of {', '.join(ENCODINGS)}!")
+            edit_config(18)
+
+    elif ch == 19:
+        print(f"Generated videos are cached up to {config['generate_cache_mb']} MB. Generating the same video with the same settings again loads it from the cache (or from a saved render) instead of downloading and converting it. The least recently used videos are removed first, 0 turns the cache off.")
+        ch = input("New cache size in MB: ")
+
+        if ch:
+            try:
+                config["generate_cache_mb"] = max(int(ch), 0)
+
+            except:
+                print("The cache size provided must be an integer!")
+                edit_config(19)
+
+            else:
+                write_config()
+                print(f"Generated video cache size has been set to {config['generate_cache_mb']} MB")
+
+        else:
+            print(CANCEL)
+
+    elif ch == 20:
+        print(f"Synchronized output is set to {config['synchronized_output']}. Every frame is wrapped in the synchronized update sequence, so terminals that support it never show a frame half drawn. Other terminals ignore it.")
+        ch = ask_boolean("Use synchronized output?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["synchronized_output"] = ch
+            write_config()
+            print(f"Synchronized output has been set to {config['synchronized_output']}")
+
+    elif ch == 21:
+        print(f"The interactive player is set to {config['interactive_player']}. It can pause, seek and change speed while playing ({KEYS_HELP}). Audio is restarted at the right spot if ffplay is installed, otherwise it only plays from the start at normal speed.")
+        ch = ask_boolean("Use the interactive player?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["interactive_player"] = ch
+            write_config()
+            print(f"Interactive player has been set to {config['interactive_player']}")
+
+    elif ch == 22:
+        print(f"Seeking moves {config['seek_seconds']} seconds forwards or backwards.")
+        ch = input("New seek step in seconds: ")
+
+        if ch:
+            try:
+                config["seek_seconds"] = max(float(ch), 0.1)
+
+            except:
+                print("The seek step provided must be a number!")
+                edit_config(22)
+
+            else:
+                write_config()
+                print(f"Seek step has been set to {config['seek_seconds']} seconds")
+
+        else:
+            print(CANCEL)
+
+    elif ch == 23:
+        print(f"Audio output is set to {config['audio_output']}. Except for playsound, the audio is decoded once with ffmpeg and the video follows how much of it has been played. 'device' is the most accurate but needs the optional sounddevice package (pip install sounddevice), 'pipe' plays through ffplay and only keeps time roughly since ffplay does not say what it has played, 'null' plays nothing but keeps time, and 'auto' picks the best one available.")
+        ch = input(f"New audio output ({', '.join(SINKS)}): ").lower()
+
+        if not ch:
+            print(CANCEL)
+
+        elif ch in SINKS:
+            config["audio_output"] = ch
+            write_config()
+            print(f"Audio output has been set to {config['audio_output']}")
+
+        else:
+            print(f"The audio output must be one of {', '.join(SINKS)}!")
+            edit_config(23)
+
+    elif ch == 24:
+        print(f"Playback reads frames ahead on a thread into a buffer of up to {config['playback_buffer_mb']} MB, so long videos play without loading every frame into memory. A bigger buffer rides out slow disks, a smaller one suits machines with little memory.")
+        ch = input("New buffer size in MB: ")
+
+        if ch:
+            try:
+                config["playback_buffer_mb"] = max(int(ch), 1)
+
+            except:
+                print("The buffer size provided must be an integer!")
+                edit_config(24)
+
+            else:
+                write_config()
+                print(f"Playback buffer has been set to {config['playback_buffer_mb']} MB")
+
+        else:
+            print(CANCEL)
+
+    elif ch == 25:
+        print(f"Adaptive quality is set to {config['adaptive_quality']}. Before playing, the terminal is timed drawing a moment of color noise. Whenever the video needs more than it can draw, it steps down from 24-bit color to 256 colors, then to shading without color, then to a lower framerate, and back up once there is room again.")
+        ch = ask_boolean("Adapt the quality to the terminal?")
+
+        if ch == "cancel":
+            print(CANCEL)
+
+        else:
+            config["adaptive_quality"] = ch
+            write_config()
+            print(f"Adaptive quality has been set to {config['adaptive_quality']}")
+
+    elif ch == 26:
         try:
             os.remove(CONFIG_FILE)
         except:
@@ -494,7 +1163,7 @@ def edit_config(resume = None):
 
         print("Settings have been reset")
 
-    elif ch == 9:
+    elif ch == 27:
         print("Exiting to main menu\n")
         return
 
@@ -527,7 +1196,7 @@ def main():
         edit_config()
 
     elif ch == 5:
-        for filename in ["video.webm", "audio.mp3", "ascii.txt", "info.json"]:
+        for filename in ["video.webm", "audio.mp3", "ascii.txt", "sequence.bin", "info.json", "master.bin", DELTA_FILE]:
             try:
                 os.remove(os.path.join("assets", filename))
             except:
@@ -556,7 +1225,8 @@ if __name__ == "__main__":
         print("Generated config file!")
 
     with open(CONFIG_FILE, "r") as f:
-        config = json.load(f)
+        # older config files are missing newer settings
+        config = {**DEFAULT_CONFIG, **json.load(f)}
 
     multiprocessing.set_start_method("fork")
 
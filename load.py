@@ -1,4 +1,5 @@
 from reset import reset_files
+from sequence import has_sequence
 import os
 import sys
 import shutil
@@ -20,13 +21,16 @@ else:
 
 storage_dir = os.path.join("stored", name)
 
-if os.path.isfile(os.path.join(storage_dir, "audio.mp3")) and os.path.isfile(os.path.join(storage_dir, "ascii.txt")):
+if os.path.isfile(os.path.join(storage_dir, "audio.mp3")) and has_sequence(storage_dir):
     choice = input("Would you like to overwrite the current files? [y/N]: ").lower()
 
     if choice in ["yes", "y"]:
         reset_files()
-        shutil.copy(os.path.join(storage_dir, "audio.mp3"), "assets")
-        shutil.copy(os.path.join(storage_dir, "ascii.txt"), "assets")
+
+        for filename in ["audio.mp3", "sequence.bin", "ascii.txt", "info.json", "delta.bin", "master.bin"]:
+            if os.path.isfile(os.path.join(storage_dir, filename)):
+                shutil.copy(os.path.join(storage_dir, filename), "assets")
+
         print(f"Loaded render from '{storage_dir}'")
 
     else:
@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILE = "manifest.json"
+
+def normalize(inputs):
+    # what the inputs look like after a round trip through json, so tuples and lists compare equal
+    return json.loads(json.dumps(inputs))
+
+class Manifest:
+    # records what every generate stage was made from and what it made, so unchanged stages can be skipped
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_FILE)
+        self.stages = {}
+        self.checksums = {}
+
+        self.reused = []
+        self.saved = 0
+
+        try:
+            with open(self.path, "r") as f:
+                self.stages = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def checksum(self, path):
+        # a directory's checksum covers its file names and sizes, hashing every frame would take too long
+        if os.path.isdir(path):
+            listing = sorted((entry.name, entry.stat().st_size) for entry in os.scandir(path))
+            return hashlib.sha256(json.dumps(listing).encode()).hexdigest()
+
+        if not os.path.isfile(path):
+            return None
+
+        # the same file is asked about by several stages, it is only hashed again if it changed
+        stat = os.stat(path)
+        identity = (path, stat.st_size, stat.st_mtime_ns)
+
+        if identity not in self.checksums:
+            digest = hashlib.sha256()
+
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(2**20), b""):
+                    digest.update(block)
+
+            self.checksums[identity] = digest.hexdigest()
+
+        return self.checksums[identity]
+
+    def fresh(self, stage, inputs):
+        # true if the stage ran with the same inputs before and its outputs are still as it left them
+        entry = self.stages.get(stage)
+
+        if not entry or entry["inputs"] != normalize(inputs):
+            return False
+
+        for path, checksum in entry["outputs"].items():
+            if self.checksum(path) != checksum:
+                return False
+
+        self.reused.append(stage)
+        self.saved += entry["seconds"]
+        return True
+
+    def record(self, stage, inputs, outputs, seconds):
+        self.stages[stage] = {
+            "inputs": normalize(inputs),
+            "outputs": {path: self.checksum(path) for path in outputs},
+            "seconds": round(seconds, 3)
+        }
+        self.save()
+
+    def output(self, stage, path):
+        return self.stages[stage]["outputs"][path]
+
+    def invalidate(self, stage):
+        if self.stages.pop(stage, None):
+            self.save()
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.stages, f, indent=4)
+
+    def report(self):
+        if not self.reused:
+            return "Every stage was run"
+        return f"Reused {', '.join(self.reused)} from the last run, saving about {self.saved:.1f} seconds"
@@ -0,0 +1,60 @@
+import os
+import sys
+
+# terminals that support it hold back drawing between these, so a frame never shows half drawn
+SYNC_BEGIN = b"\033[?2026h"
+SYNC_END = b"\033[?2026l"
+
+HIDE_CURSOR = b"\033[?25l"
+SHOW_CURSOR = b"\033[?25h"
+CURSOR_HOME = b"\033[H"
+
+def write_all(fd, data):
+    # os.write can take only part of a big frame, especially on a pipe or a slow tty
+    view = memoryview(data)
+
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+class FrameOutput:
+    # writes every frame with one os.write on the terminal's file descriptor, skipping python's text layers
+    # full frames are drawn from the top left corner instead of scrolling the previous one away
+    def __init__(self, fd=None, synchronized=False, home=True):
+        self.fd = sys.stdout.fileno() if fd is None else fd
+        self.synchronized = synchronized
+        self.home = home
+
+    def encode(self, frame):
+        if isinstance(frame, str):
+            frame = frame.encode()
+
+        parts = [frame]
+
+        if self.home:
+            parts.insert(0, CURSOR_HOME)
+        if self.synchronized:
+            parts = [SYNC_BEGIN, *parts, SYNC_END]
+
+        return b"".join(parts) if len(parts) > 1 else frame
+
+    def write(self, frame):
+        # returns how many bytes went to the terminal
+        data = self.encode(frame)
+        write_all(self.fd, data)
+        return len(data)
+
+    def start(self):
+        # anything python still has buffered has to go out before the first frame
+        sys.stdout.flush()
+        write_all(self.fd, HIDE_CURSOR)
+
+    def finish(self):
+        write_all(self.fd, SHOW_CURSOR)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.finish()
@@ -0,0 +1,124 @@
+import time
+import queue
+import threading
+
+END = object()
+
+class Pipeline:
+    # decode -> convert -> playback, joined by bounded queues so no stage can run away with memory
+    # every converted frame is written to the sequence writer on its way to playback
+    def __init__(self, frames, convert, writer, framerate, frame_count=None, queue_size=None, min_buffer=None):
+        self.frames = frames
+        self.convert = convert
+        self.writer = writer
+        self.framerate = framerate
+        self.frame_count = frame_count
+        self.min_buffer = min_buffer or framerate
+
+        self.decoded = queue.Queue(maxsize=queue_size or framerate * 2)
+        self.converted = queue.Queue(maxsize=queue_size or framerate * 10)
+        self.stop = threading.Event()
+        self.done = threading.Event()
+        self.produced = 0
+        self.started = None
+
+        self.threads = [
+            threading.Thread(target=self.decode, daemon=True),
+            threading.Thread(target=self.convert_frames, daemon=True)
+        ]
+
+    def put(self, target, item):
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def drain(self, source):
+        while not self.stop.is_set():
+            try:
+                item = source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if item is END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+
+            yield item
+
+    def decode(self):
+        try:
+            for pixels in self.frames:
+                if not self.put(self.decoded, pixels):
+                    return
+            self.put(self.decoded, END)
+
+        except BaseException as error:
+            self.put(self.decoded, error)
+
+    def convert_frames(self):
+        try:
+            for text_frame in self.convert(self.drain(self.decoded)):
+                self.writer.write(text_frame)
+                self.produced += 1
+
+                if not self.put(self.converted, text_frame):
+                    return
+
+            self.put(self.converted, END)
+
+        except BaseException as error:
+            self.put(self.converted, error)
+
+        finally:
+            self.done.set()
+
+    def conversion_rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.produced / elapsed if elapsed > 0 else 0
+
+    def ready(self):
+        buffered = self.converted.qsize()
+
+        if self.done.is_set() or self.converted.full():
+            return True
+        if buffered < self.min_buffer:
+            return False
+
+        rate = self.conversion_rate()
+        if rate >= self.framerate:
+            return True
+
+        # slower than realtime: the buffer has to cover the shortfall until the end
+        if self.frame_count:
+            remaining = max(self.frame_count - self.produced, 0)
+            return buffered >= remaining * (1 - rate / self.framerate)
+
+        return False
+
+    def start(self):
+        self.started = time.monotonic()
+        for thread in self.threads:
+            thread.start()
+
+    def wait_until_ready(self, progress=None):
+        while not self.ready():
+            if progress:
+                progress(self.converted.qsize(), self.conversion_rate())
+            time.sleep(0.1)
+
+    def __iter__(self):
+        try:
+            yield from self.drain(self.converted)
+
+        finally:
+            # stopping early leaves the sequence file with whatever was converted so far
+            if not self.done.is_set():
+                self.stop.set()
+
+            for thread in self.threads:
+                thread.join()
\ No newline at end of file
@@ -0,0 +1,602 @@
+import os
+import sys
+import time
+import shutil
+import signal
+import asyncio
+import subprocess
+import concurrent.futures
+import numpy as np
+
+from delta import split_cells, frame_delta
+from output import FrameOutput
+from audio import SAMPLE_RATE, AudioClock
+from prefetch import BUFFER_MB, PrefetchBuffer
+
+SPEEDS = [0.5, 0.75, 1, 1.25, 1.5, 2]
+SEEK_SECONDS = 5
+
+KEYS_HELP = "[space] pause  [←/→] seek  [↑/↓] speed  [q] quit"
+
+# escape sequences of the arrow keys, and what windows' getwch returns after its 0xe0 prefix
+ARROWS = {"\033[A": "up", "\033[B": "down", "\033[C": "right", "\033[D": "left"}
+WINDOWS_ARROWS = {"H": "up", "P": "down", "M": "right", "K": "left"}
+
+CLEAR_SCREEN = "\033[0m\033[2J"
+# how often the terminal size is checked where there is no SIGWINCH
+RESIZE_POLL_SECONDS = 0.5
+
+class MediaClock:
+    # position in the video, in seconds, which can be paused, moved and sped up
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.position = 0
+        self.speed = 1
+        self.started = None
+
+    @property
+    def playing(self):
+        return self.started is not None
+
+    def now(self):
+        if self.started is None:
+            return self.position
+        return self.position + (self.clock() - self.started) * self.speed
+
+    def pause(self):
+        self.position = self.now()
+        self.started = None
+
+    def resume(self):
+        self.started = self.clock()
+
+    def seek(self, position):
+        self.position = max(position, 0)
+        if self.playing:
+            self.started = self.clock()
+
+    def set_speed(self, speed):
+        self.position = self.now()
+        if self.playing:
+            self.started = self.clock()
+        self.speed = speed
+
+class AudioMediaClock(MediaClock):
+    # a MediaClock that follows the audio it plays, so the audio is the master clock,
+    # after every pause, seek or speed change the audio is started again from the right sample
+    def __init__(self, samples, sink, rate=SAMPLE_RATE):
+        super().__init__()
+        self.samples = samples
+        self.sink = sink
+        self.rate = rate
+        self.audio = None
+
+    @property
+    def playing(self):
+        return self.audio is not None
+
+    def now(self):
+        if self.audio is None:
+            return self.position
+        # every second of audio heard covers speed seconds of the video
+        return self.position + self.audio.position() * self.speed
+
+    def start_audio(self):
+        samples = self.samples[int(self.position * self.rate):]
+
+        # played faster or slower by taking every speed-th sample, which shifts the pitch like a record would
+        if self.speed != 1:
+            samples = samples[(np.arange(0, len(samples), self.speed)).astype(np.int64)]
+
+        self.audio = AudioClock(samples, self.sink, self.rate)
+        self.audio.start()
+
+    def stop_audio(self):
+        if self.audio:
+            self.audio.stop()
+            self.audio = None
+
+    def pause(self):
+        self.position = self.now()
+        self.stop_audio()
+
+    def resume(self):
+        self.start_audio()
+
+    def seek(self, position):
+        playing = self.playing
+        self.stop_audio()
+        self.position = max(position, 0)
+
+        if playing:
+            self.start_audio()
+
+    def set_speed(self, speed):
+        playing = self.playing
+        self.pause()
+        self.speed = speed
+
+        if playing:
+            self.start_audio()
+
+def key_names(text):
+    keys = []
+
+    while text:
+        for sequence, name in ARROWS.items():
+            if text.startswith(sequence):
+                keys.append(name)
+                text = text[len(sequence):]
+                break
+        else:
+            keys.append(text[0])
+            text = text[1:]
+
+    return keys
+
+class Keyboard:
+    # puts the terminal in cbreak mode and hands every key press to a callback on the event loop
+    def __init__(self, callback):
+        self.callback = callback
+        self.fd = None
+        self.settings = None
+        self.task = None
+
+    def __enter__(self):
+        if not sys.stdin.isatty():
+            return self
+
+        if os.name == "nt":
+            self.task = asyncio.get_running_loop().create_task(self.poll_windows())
+            return self
+
+        import tty
+        import termios
+
+        self.fd = sys.stdin.fileno()
+        self.settings = termios.tcgetattr(self.fd)
+        # cbreak keeps ctrl + C working, which still restores everything on the way out
+        tty.setcbreak(self.fd)
+        asyncio.get_running_loop().add_reader(self.fd, self.read)
+        return self
+
+    def read(self):
+        for key in key_names(os.read(self.fd, 64).decode(errors="ignore")):
+            self.callback(key)
+
+    async def poll_windows(self):
+        import msvcrt
+
+        while True:
+            while msvcrt.kbhit():
+                key = msvcrt.getwch()
+                if key in "\x00\xe0":
+                    key = WINDOWS_ARROWS.get(msvcrt.getwch(), "")
+                self.callback(key)
+
+            await asyncio.sleep(0.05)
+
+    def __exit__(self, *args):
+        if self.task:
+            self.task.cancel()
+
+        if self.fd is not None:
+            import termios
+
+            asyncio.get_running_loop().remove_reader(self.fd)
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.settings)
+
+def audio_command(audio_file, position, speed):
+    # ffplay can start anywhere in the file and change the tempo, playsound can only play it from the start
+    if shutil.which("ffplay"):
+        return ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-ss", f"{position:.3f}", "-af", f"atempo={speed}", audio_file]
+
+    if position == 0 and speed == 1:
+        return [sys.executable, "-c", "import sys; from playsound import playsound; playsound(sys.argv[1])", audio_file]
+
+    return None
+
+def numbered_frames(frames, start):
+    # (number, text) for every frame from start on, read in order where the frames can be
+    if not hasattr(frames, "frames_from"):
+        for number in range(start, len(frames)):
+            yield number, frames[number]
+        return
+
+    # repeats are the same bytes object, so they are only decoded once
+    previous = None
+    text = None
+
+    for number, frame in enumerate(frames.frames_from(start), start):
+        if frame is not previous:
+            text = bytes(frame).decode()
+            previous = frame
+        yield number, text
+
+def frame_size(item):
+    return sys.getsizeof(item[1])
+
+def timestamp(seconds):
+    return f"{int(seconds) // 60:02}:{int(seconds) % 60:02}"
+
+def terminal_size():
+    size = shutil.get_terminal_size()
+    return (size.columns, size.lines)
+
+class Player:
+    # frames is anything indexable, a SequenceReader finds any frame through its index without reading the ones before
+    # frame scheduling and key presses each run as their own task
+    # with samples (decoded by audio.decode_pcm) and a sink, frames follow an AudioClock playing them,
+    # otherwise they follow the wall clock and ffplay or playsound plays audio_file next to it
+    # with renditions (a rerender.Renditions of the master copy) the video follows the terminal when it is resized,
+    # and with quality (a quality.QualityGovernor) frames are drawn with less color or left out when the terminal cannot keep up
+    def __init__(self, frames, framerate, width, height, audio_file=None, delta=True, synchronized=False, seek_seconds=SEEK_SECONDS, stats=None, renditions=None, quality=None, samples=None, sink=None, buffer_bytes=BUFFER_MB * 2**20):
+        self.frames = frames
+        self.framerate = framerate
+        self.width = width
+        self.height = height
+        self.audio_file = audio_file
+        self.delta = delta
+        self.synchronized = synchronized
+        self.seek_seconds = seek_seconds
+        self.stats = stats
+        self.renditions = renditions
+        self.quality = quality
+
+        # frames are read and renditions opened on one thread of their own, so a slow frame never holds up the clock or the keys
+        self.reader = concurrent.futures.ThreadPoolExecutor(1)
+        self.size = (width, height)
+
+        # frames come through a read ahead buffer from the playhead on, which is started again wherever playback jumps to
+        self.buffer_bytes = buffer_bytes
+        self.buffer = None
+        self.buffered = None
+        self.buffer_frames = None
+        self.upcoming = None
+        self.refill = False
+        self.fetched = (None, None, None)
+        self.buffer_totals = {"stalls": 0, "stalled_seconds": 0, "peak_bytes": 0, "refills": 0}
+
+        if samples is not None and sink is not None:
+            self.clock = AudioMediaClock(samples, sink)
+            self.audio_file = None
+        else:
+            self.clock = MediaClock()
+
+        self.output = None
+        self.audio = None
+        self.quit = False
+
+        # the last frame drawn, None after a seek so the next one is drawn in full
+        self.shown = None
+        self.shown_frame = None
+        self.cells = None
+        self.status_second = None
+
+        self.drawn = 0
+        self.repeated = 0
+        self.dropped = 0
+        self.seeks = 0
+        self.resizes = 0
+
+    def duration(self):
+        return len(self.frames) / self.framerate
+
+    async def read(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.reader, function, *args)
+
+    def close_buffer(self):
+        if self.buffer is None:
+            return
+
+        self.buffered.close()
+        self.buffer_totals["stalls"] += self.buffer.stalls
+        self.buffer_totals["stalled_seconds"] += self.buffer.stalled
+        self.buffer_totals["peak_bytes"] = max(self.buffer_totals["peak_bytes"], self.buffer.peak)
+        self.buffer = None
+
+    def fetch(self, frames, number):
+        # runs on the reader thread, frames a little ahead are read through, anything else starts the buffer again
+        # the frame drawn last comes again after a pause or a resize redraws the screen
+        if self.fetched[:2] == (frames, number) and not self.refill:
+            return self.fetched[2]
+
+        jump = self.upcoming is None or number < self.upcoming or number > self.upcoming + self.framerate
+
+        if self.refill or jump or frames is not self.buffer_frames:
+            self.close_buffer()
+            self.refill = False
+
+            self.buffer = PrefetchBuffer(numbered_frames(frames, number), self.buffer_bytes, frame_size)
+            self.buffered = iter(self.buffer)
+            self.buffer_frames = frames
+            self.buffer_totals["refills"] += 1
+
+        for item_number, frame in self.buffered:
+            self.upcoming = item_number + 1
+            if item_number == number:
+                self.fetched = (frames, number, frame)
+                return frame
+
+        self.upcoming = None
+        return frames[number]
+
+    def prepare(self, frames, number, shown_frame, shown_cells):
+        # runs on the reader thread, so converting a frame for the quality level and diffing it never holds up the loop
+        # the frame, or None if the quality level leaves it out, then its cells and the delta from the ones on screen
+        frame = self.fetch(frames, number)
+
+        if self.quality:
+            frame = self.quality.apply(frame, number)
+
+        if frame is None or frame == shown_frame or not self.delta:
+            return frame, None, None
+
+        cells = split_cells(frame)
+        return frame, cells, frame_delta(shown_cells, cells, self.width)
+
+    async def draw(self, number):
+        # false if the frames were switched for another terminal size while this one was read
+        frames = self.frames
+        shown_cells = self.cells
+        frame, cells, delta = await self.read(self.prepare, frames, number, self.shown_frame, shown_cells)
+
+        if frames is not self.frames:
+            return False
+
+        if frame is None:
+            return True
+
+        # the governor is only touched on the reader thread, after this frame and before the next one
+        if frame == self.shown_frame:
+            self.repeated += 1
+            if self.quality:
+                self.reader.submit(self.quality.wrote, 0)
+            return True
+
+        start = time.perf_counter()
+
+        if self.delta:
+            # the screen was forgotten while the delta was made, so it is drawn in full
+            if cells is None or self.cells is not shown_cells:
+                cells = split_cells(frame)
+                delta = frame_delta(self.cells, cells, self.width)
+
+            size = self.output.write(delta)
+            self.cells = cells
+        else:
+            size = self.output.write(frame)
+
+        if self.quality:
+            self.reader.submit(self.quality.wrote, size)
+
+        if self.stats:
+            self.stats.sample("frame_write", time.perf_counter() - start)
+
+        self.shown_frame = frame
+        self.drawn += 1
+        return True
+
+    def status(self):
+        state = "▶" if self.clock.playing else "⏸"
+        line = f"{state} {timestamp(self.clock.now())} / {timestamp(self.duration())}  {self.clock.speed}x  {KEYS_HELP}"
+        self.output.write(f"\033[{self.height};1H\033[0m\033[2K{line[:self.width - 1]}")
+        self.status_second = int(self.clock.now())
+
+    def forget_screen(self):
+        # the next frame is drawn in full
+        self.shown = None
+        self.shown_frame = None
+        self.cells = None
+
+    def changed(self, seeked=False):
+        if seeked:
+            self.seeks += 1
+            self.forget_screen()
+
+        self.wake.set()
+        self.restart_audio.set()
+        self.status()
+
+    def on_key(self, key):
+        if key in [" ", "p"]:
+            if self.clock.playing:
+                self.clock.pause()
+            else:
+                self.clock.resume()
+            self.changed()
+
+        elif key in ["left", "right", "h", "l"]:
+            direction = 1 if key in ["right", "l"] else -1
+            position = min(self.clock.now() + direction * self.seek_seconds, self.duration())
+            self.clock.seek(position)
+            self.refill = True
+            self.changed(seeked=True)
+
+        elif key in ["up", "down", "+", "-"]:
+            step = 1 if key in ["up", "+"] else -1
+            index = min(max(SPEEDS.index(self.clock.speed) + step, 0), len(SPEEDS) - 1)
+            self.clock.set_speed(SPEEDS[index])
+            self.refill = True
+            self.changed()
+
+        elif key in ["q", "Q"]:
+            self.quit = True
+            self.wake.set()
+
+    async def sleep(self, seconds):
+        # a key press cuts the wait short
+        try:
+            await asyncio.wait_for(self.wake.wait(), max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+        self.wake.clear()
+
+    async def show_frames(self):
+        while not self.quit:
+            number = int(self.clock.now() * self.framerate)
+
+            if number >= len(self.frames):
+                if self.clock.playing:
+                    return
+                number = len(self.frames) - 1
+
+            # a seek while paused still shows the frame it landed on
+            if number != self.shown:
+                if self.shown is not None and number > self.shown + 1:
+                    self.dropped += number - self.shown - 1
+
+                if await self.draw(number):
+                    self.shown = number
+
+            if int(self.clock.now()) != self.status_second:
+                self.status()
+
+            if not self.clock.playing:
+                await self.sleep(1)
+                continue
+
+            await self.sleep(((number + 1) / self.framerate - self.clock.now()) / self.clock.speed)
+
+    async def stop_audio(self):
+        if self.audio and self.audio.returncode is None:
+            self.audio.terminate()
+            await self.audio.wait()
+        self.audio = None
+
+    async def play_audio(self):
+        # restarted at the current position and speed after every change
+        while True:
+            await self.stop_audio()
+
+            if self.clock.playing:
+                command = audio_command(self.audio_file, self.clock.now(), self.clock.speed)
+                if command:
+                    self.audio = await asyncio.create_subprocess_exec(*command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+            await self.restart_audio.wait()
+            self.restart_audio.clear()
+
+    def show(self, frames, size):
+        # switches to frames rendered for size, from a clean screen
+        self.frames = frames
+        self.width, self.height = size
+        self.forget_screen()
+        self.output.write(CLEAR_SCREEN)
+        self.status()
+        self.wake.set()
+
+        # reads of the old frames were queued before this, so closing them on the reader thread waits for those
+        self.reader.submit(self.release)
+
+    def release(self):
+        # on the reader thread, closes the frames the renditions dropped, apart from the ones on screen
+        if self.buffer_frames is not self.frames:
+            self.close_buffer()
+            self.buffer_frames = None
+            self.upcoming = None
+            self.fetched = (None, None, None)
+
+        self.renditions.release(keep=self.frames)
+
+    async def switch(self, size):
+        if self.renditions is None:
+            # nothing to render a new size from, the screen is cleared so the wrapped frame does not linger
+            self.height = size[1]
+            self.forget_screen()
+            self.output.write(CLEAR_SCREEN)
+            self.status()
+            return
+
+        loop = asyncio.get_running_loop()
+
+        def ready(size):
+            loop.call_soon_threadsafe(lambda: loop.create_task(self.rendered(size)))
+
+        frames = await self.read(self.renditions.get, size, ready)
+
+        # a newer resize may have come in while the rendition was opened
+        if size == self.size:
+            self.show(frames, size)
+        else:
+            self.reader.submit(self.release)
+
+    async def rendered(self, size):
+        frames = await self.read(self.renditions.finished, size)
+
+        if frames is None:
+            return
+
+        if size == self.size:
+            self.show(frames, size)
+        else:
+            self.reader.submit(self.release)
+
+    def on_resize(self):
+        size = terminal_size()
+
+        if size != self.size:
+            self.size = size
+            self.resizes += 1
+            asyncio.get_running_loop().create_task(self.switch(size))
+
+    async def poll_size(self):
+        while True:
+            await asyncio.sleep(RESIZE_POLL_SECONDS)
+            self.on_resize()
+
+    async def run(self):
+        self.wake = asyncio.Event()
+        self.restart_audio = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        with FrameOutput(synchronized=self.synchronized, home=not self.delta) as self.output, Keyboard(self.on_key):
+            self.clock.resume()
+            self.status()
+
+            tasks = []
+            if self.audio_file:
+                tasks.append(asyncio.create_task(self.play_audio()))
+
+            if hasattr(signal, "SIGWINCH"):
+                loop.add_signal_handler(signal.SIGWINCH, self.on_resize)
+            else:
+                tasks.append(asyncio.create_task(self.poll_size()))
+
+            try:
+                await self.show_frames()
+
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await self.stop_audio()
+                # stops the audio clock's audio too
+                self.clock.pause()
+
+                if hasattr(signal, "SIGWINCH"):
+                    loop.remove_signal_handler(signal.SIGWINCH)
+
+                self.output.write(f"\033[0m\033[{self.height};1H\033[2K")
+
+    def play(self):
+        try:
+            asyncio.run(self.run())
+        finally:
+            self.reader.shutdown()
+            self.close_buffer()
+
+            # frames dropped while they were still on screen are closed now nothing draws from them
+            if self.renditions:
+                self.renditions.release()
+
+    def buffer_summary(self):
+        return {"limit_bytes": self.buffer_bytes, **self.buffer_totals, "stalled_seconds": round(self.buffer_totals["stalled_seconds"], 3)}
+
+    def summary(self):
+        return {"drawn": self.drawn, "repeated": self.repeated, "dropped": self.dropped, "seeks": self.seeks, "resizes": self.resizes, "terminal_size": list(self.size), "buffer": self.buffer_summary()}
+
+    def report(self):
+        totals = self.buffer_totals
+        buffer = f"{totals['stalls']} buffer stalls ({totals['stalled_seconds']:.2f} s), at most {totals['peak_bytes'] / 2**20:.1f} of {self.buffer_bytes / 2**20:.0f} MiB read ahead"
+        return f"{self.drawn} frames drawn, {self.repeated} repeated, {self.dropped} dropped, {self.seeks} seeks, {self.resizes} resizes\n{buffer}"
@@ -0,0 +1,107 @@
+import sys
+import time
+import threading
+import collections
+
+# what playback may keep read ahead when nothing else is configured
+BUFFER_MB = 64
+
+class PrefetchBuffer:
+    # frames read ahead on a thread into a buffer that never holds more than limit bytes,
+    # so a render of any length plays in the same amount of memory
+    # sizeof tells how many bytes an item takes, for items that are not frames themselves
+    def __init__(self, frames, limit=BUFFER_MB * 2**20, sizeof=sys.getsizeof):
+        self.frames = iter(frames)
+        self.limit = limit
+        self.sizeof = sizeof
+
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+
+        self.buffered = 0
+        self.done = False
+        self.stopped = False
+        self.error = None
+
+        self.peak = 0
+        self.stalls = 0
+        self.stalled = 0
+
+    def fill(self):
+        try:
+            for frame in self.frames:
+                # repeats are the same object, counting them again only makes the cap stricter
+                size = self.sizeof(frame)
+
+                with self.condition:
+                    # a frame bigger than the whole buffer still goes in once the buffer is empty
+                    while self.queue and self.buffered + size > self.limit and not self.stopped:
+                        self.condition.wait()
+
+                    if self.stopped:
+                        return
+
+                    self.queue.append((frame, size))
+                    self.buffered += size
+                    self.peak = max(self.peak, self.buffered)
+                    self.condition.notify_all()
+
+        except Exception as error:
+            self.error = error
+
+        finally:
+            # the source is closed on the thread that was reading it
+            if hasattr(self.frames, "close"):
+                self.frames.close()
+
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def __iter__(self):
+        self.thread.start()
+        first = True
+
+        try:
+            while True:
+                with self.condition:
+                    if not self.queue and not self.done:
+                        # waiting for the first frame is only the buffer filling up, not a stall
+                        start = time.perf_counter()
+
+                        while not self.queue and not self.done:
+                            self.condition.wait()
+
+                        if not first:
+                            self.stalls += 1
+                            self.stalled += time.perf_counter() - start
+
+                    if not self.queue:
+                        if self.error:
+                            raise self.error
+                        return
+
+                    frame, size = self.queue.popleft()
+                    self.buffered -= size
+                    self.condition.notify_all()
+
+                first = False
+                yield frame
+
+        finally:
+            self.close()
+
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def summary(self):
+        return {"limit_bytes": self.limit, "peak_bytes": self.peak, "stalls": self.stalls, "stalled_seconds": round(self.stalled, 3)}
+
+    def report(self):
+        return f"{self.stalls} buffer stalls ({self.stalled:.2f} s), at most {self.peak / 2**20:.1f} of {self.limit / 2**20:.0f} MiB read ahead"
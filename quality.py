@@ -0,0 +1,260 @@
+import os
+import re
+import time
+import collections
+import numpy as np
+
+from convert import UNICODE_BLOCK, SHADING, COLOR_PREFIX, HALF_BLOCK, shade_table, frame_to_text
+from output import CURSOR_HOME, write_all
+
+# from best to cheapest: 24-bit color, the 256 color palette, no color at all, then fewer frames
+LEVELS = [
+    ("truecolor", 1),
+    ("256color", 1),
+    ("shading", 1),
+    ("shading", 2),
+    ("shading", 4)
+]
+SHADING_LEVEL = 2
+
+CALIBRATION_SECONDS = 0.5
+# share of the measured throughput frames may use, the rest is left for the status line and hiccups
+HEADROOM = 0.8
+# a level is only stepped back up to when it would use less than this share of its budget
+STEP_UP = 0.8
+# seconds before a level that had to be left is tried again, doubling every time it has to be left again
+RETRY_SECONDS = 2
+MAX_RETRY_SECONDS = 60
+
+# a color escape, with the background of a half block or without
+COLOR_ESCAPE = re.compile("\033\\[38;2;[\\d;]+m")
+
+# channel values of the 6x6x6 color cube in the 256 color palette, and where each one's range starts
+CUBE_LEVELS = np.array([0, 95, 135, 175, 215, 255])
+CUBE_EDGES = [48, 115, 155, 195, 235]
+FOREGROUND_256 = [f"\033[38;5;{color}m" for color in range(256)]
+# shading frames start with it, the colors of a frame drawn before at another level would stay in effect otherwise
+RESET_COLOR = "\033[0m"
+
+def calibrate(fd, size, seconds=CALIBRATION_SECONDS):
+    # bytes per second the terminal takes in, from drawing full frames of color noise for a moment
+    width, height = size
+    rng = np.random.default_rng(0)
+    frames = [CURSOR_HOME + frame_to_text(rng.integers(0, 256, (max(height - 1, 1), width, 3), dtype=np.uint8), None, True, color_runs=True).encode() for _ in range(2)]
+
+    written = 0
+    count = 0
+    start = time.perf_counter()
+
+    # two different frames, so a terminal cannot skip drawing one that did not change
+    while time.perf_counter() - start < seconds:
+        frame = frames[count % 2]
+        write_all(fd, frame)
+        written += len(frame)
+        count += 1
+
+    # writes only wait for the kernel's buffer, the terminal has to have drawn it all before the time is taken
+    try:
+        import termios
+    except ImportError:
+        termios = None
+
+    if termios and os.isatty(fd):
+        try:
+            termios.tcdrain(fd)
+        except termios.error:
+            pass
+
+    seconds = time.perf_counter() - start
+    write_all(fd, b"\033[0m\033[2J" + CURSOR_HOME)
+    return written / seconds
+
+def color_runs(frame):
+    # the text before the first color escape, the numbers of every escape as rows of an array, and the cells after each one
+    # a frame is all foreground escapes or all half block ones, so the rows are the same length
+    pieces = COLOR_ESCAPE.split(frame)
+    escapes = COLOR_ESCAPE.findall(frame)
+
+    if not escapes:
+        return frame, None, []
+
+    numbers = ";".join(escape[7:-1] for escape in escapes).split(";")
+    return pieces[0], np.array(numbers, dtype=np.int32).reshape(len(escapes), -1), pieces[1:]
+
+def palette_256(colors):
+    # the nearest of the color cube and the gray ramp for every (red, green, blue) row
+    cube = np.searchsorted(CUBE_EDGES, colors, side="right")
+    cube_distance = ((CUBE_LEVELS[cube] - colors) ** 2).sum(axis=-1)
+
+    gray = np.clip((colors.sum(axis=-1) // 3 - 3) // 10, 0, 23)
+    gray_distance = ((8 + gray[:, None] * 10 - colors) ** 2).sum(axis=-1)
+
+    return np.where(gray_distance < cube_distance, 232 + gray, 16 + 36 * cube[:, 0] + 6 * cube[:, 1] + cube[:, 2])
+
+def to_256(frame):
+    head, values, cells = color_runs(frame)
+
+    if values is None:
+        return frame
+
+    foreground = palette_256(values[:, :3]).tolist()
+
+    if values.shape[1] > 3:
+        background = palette_256(values[:, 5:8]).tolist()
+        escapes = [f"\033[38;5;{front};48;5;{back}m" for front, back in zip(foreground, background)]
+    else:
+        escapes = [FOREGROUND_256[color] for color in foreground]
+
+    return head + "".join(escape + run for escape, run in zip(escapes, cells))
+
+def to_shading(frame, shading=SHADING):
+    # solid and half blocks get the shading character of their color's brightness,
+    # shading characters and braille dots already show the picture without color
+    head, values, cells = color_runs(frame)
+
+    if values is None:
+        return frame
+
+    value = values[:, :3].sum(axis=1)
+
+    if values.shape[1] > 3:
+        value = (value + values[:, 5:8].sum(axis=1)) // 2
+
+    table = shade_table(tuple(shading))
+    chars = [table[brightness] for brightness in (value // 3).tolist()]
+
+    return RESET_COLOR + head + "".join(run.replace(UNICODE_BLOCK, char).replace(HALF_BLOCK, char) for char, run in zip(chars, cells))
+
+class QualityGovernor:
+    # picks how each frame is drawn so what is written stays within what the terminal can take in,
+    # stepping down a level when the last second of frames went over the budget,
+    # and back up once the level above, scaled by how much bigger it makes the current frame, would fit
+    def __init__(self, throughput, framerate, shading=None):
+        self.throughput = throughput
+        self.framerate = framerate
+        self.shading = shading or SHADING
+
+        self.level = 0
+        self.best = 0
+        self.checked = False
+        # bytes of every frame drawn in the last second of video, a repeated one costs nothing,
+        # the window is measured in video time since frames dropped for falling behind never get here
+        self.sizes = []
+        self.window_start = 0
+        # frame number from which each level may be tried again, and how long it waits the next time
+        self.retry_at = {}
+        self.retry_seconds = {}
+
+        self.number = 0
+        self.changes = [{"frame": 0, **self.describe()}]
+        self.frames = collections.Counter()
+        # the last frame converted at each level, so repeats and the growth estimate convert nothing again
+        self.converted = {}
+        self.source = None
+
+    def describe(self):
+        name, divisor = LEVELS[self.level]
+        return {"level": name, "framerate": self.framerate / divisor}
+
+    def budget(self, level=None):
+        # bytes one drawn frame may take
+        level = self.level if level is None else level
+        return self.throughput * HEADROOM * LEVELS[level][1] / self.framerate
+
+    def apply(self, frame, number):
+        # the frame as the current level draws it, or None if the level leaves this frame out
+        self.number = number
+
+        # frames without any color start at shading, the color levels would change nothing
+        if not self.checked:
+            self.checked = True
+            if COLOR_PREFIX not in (frame.decode() if isinstance(frame, bytes) else frame):
+                self.level = self.best = SHADING_LEVEL
+                self.changes = [{"frame": number, **self.describe()}]
+
+        name, divisor = LEVELS[self.level]
+
+        if number % divisor:
+            return None
+
+        self.frames[self.level] += 1
+        self.source = frame
+        return self.convert(frame, self.level)
+
+    def convert(self, frame, level):
+        name = LEVELS[level][0]
+        last = self.converted.get(name)
+
+        if last and last[0] == frame:
+            return last[1]
+
+        text = self.convert_text(frame, name)
+        self.converted[name] = (frame, text)
+        return text
+
+    def convert_text(self, frame, name):
+        if name == "truecolor":
+            return frame
+
+        text = frame.decode() if isinstance(frame, bytes) else frame
+        return to_256(text) if name == "256color" else to_shading(text, self.shading)
+
+    def growth(self, level):
+        # how many times bigger the level above makes the last frame
+        if LEVELS[level][0] == LEVELS[level - 1][0]:
+            return 1
+
+        def size(frame):
+            return len(frame.encode() if isinstance(frame, str) else frame)
+
+        return size(self.convert(self.source, level - 1)) / max(size(self.convert(self.source, level)), 1)
+
+    def wrote(self, size):
+        self.sizes.append(size)
+
+        if self.number - self.window_start < self.framerate:
+            return
+
+        average = sum(self.sizes) / len(self.sizes)
+
+        if average > self.budget() and self.level < len(LEVELS) - 1:
+            # the longer a level keeps failing, the less often it is tried
+            seconds = self.retry_seconds.get(self.level, RETRY_SECONDS / 2) * 2
+            self.retry_seconds[self.level] = min(seconds, MAX_RETRY_SECONDS)
+            self.retry_at[self.level] = self.number + self.retry_seconds[self.level] * self.framerate
+            self.change(self.level + 1)
+
+        elif self.level > self.best and self.number >= self.retry_at.get(self.level - 1, 0):
+            if average * self.growth(self.level) < self.budget(self.level - 1) * STEP_UP:
+                self.change(self.level - 1)
+                return
+
+        self.sizes.clear()
+        self.window_start = self.number
+
+    def change(self, level):
+        self.level = level
+        self.sizes.clear()
+        self.window_start = self.number
+        self.changes.append({"frame": self.number, **self.describe()})
+
+    def adapted(self, frames):
+        # for a stream of (number in the source, frame), left out frames are not passed on at all,
+        # the one before stays on screen and nothing is written for them, so they do not count towards the budget
+        for number, frame in frames:
+            adapted = self.apply(frame, number)
+            if adapted is not None:
+                yield adapted
+
+    def summary(self):
+        return {
+            "throughput_bytes_per_second": round(self.throughput),
+            "budget_bytes_per_frame": round(self.budget()),
+            "final": self.describe(),
+            "changes": self.changes,
+            "frames_per_level": {f"{LEVELS[level][0]}@{self.framerate / LEVELS[level][1]:g}fps": count for level, count in sorted(self.frames.items())}
+        }
+
+    def report(self):
+        levels = ", ".join(f"{change['level']} at {change['framerate']:g} FPS from frame {change['frame']}" for change in self.changes)
+        return f"terminal takes {self.throughput / 2**20:.1f} MiB/s, {levels}"
@@ -0,0 +1,126 @@
+import os
+import json
+import shutil
+import hashlib
+
+RENDERS_DIR = os.path.join("cache", "renders")
+STORED_DIR = "stored"
+
+# everything play() needs, the downloaded video is only used while generating
+RENDER_FILES = ["audio.mp3", "sequence.bin", "ascii.txt", "info.json", "delta.bin", "master.bin"]
+
+def file_hash(path):
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def source_id(path):
+    # urls are trusted to keep pointing at the same video, local files are identified by content
+    if "http://" in path or "https://" in path:
+        return f"url:{path}"
+    return f"sha256:{file_hash(path)}"
+
+def render_key(source, framerate, terminal_size, shade, shading, color, tolerance=0, encoding="cell"):
+    settings = json.dumps([source, framerate, list(terminal_size), shade, shading, color, tolerance, encoding])
+    return hashlib.sha1(settings.encode()).hexdigest()[:20]
+
+def read_key(directory):
+    try:
+        with open(os.path.join(directory, "info.json"), "r") as f:
+            return json.load(f).get("render_key")
+    except (OSError, ValueError):
+        return None
+
+def find_render(key):
+    # returns the directory of a finished render with this key, stored renders count as entries too
+    path = os.path.join(RENDERS_DIR, key)
+
+    if read_key(path) == key:
+        # the directory's time is what eviction goes by
+        os.utime(path)
+        return path
+
+    if os.path.isdir(STORED_DIR):
+        for name in sorted(os.listdir(STORED_DIR)):
+            directory = os.path.join(STORED_DIR, name)
+            if read_key(directory) == key:
+                return directory
+
+    return None
+
+def copy_render(source, dest):
+    for filename in RENDER_FILES:
+        if os.path.isfile(os.path.join(source, filename)):
+            shutil.copy(os.path.join(source, filename), dest)
+
+def replace_render(source, destination):
+    # copied under a temporary name and swapped in, so the old render stays until the copy has worked
+    # and an interrupted copy is never found
+    if os.path.isdir(destination + ".tmp"):
+        shutil.rmtree(destination + ".tmp")
+    os.makedirs(destination + ".tmp")
+
+    copy_render(source, destination + ".tmp")
+
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    os.replace(destination + ".tmp", destination)
+
+def load_render(source, destination):
+    # swaps the render files in destination for the ones in source, anything else there is left alone
+    os.makedirs(destination, exist_ok=True)
+
+    for filename in RENDER_FILES:
+        if os.path.isfile(os.path.join(destination, filename)):
+            os.remove(os.path.join(destination, filename))
+
+    copy_render(source, destination)
+
+def directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+def evict_oldest(entries, limit_bytes, remove, keep=None):
+    # removes (time, size, path) entries oldest first until the rest fit in limit_bytes, keep is never removed
+    entries = sorted(entries)
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+
+    for _, size, path in entries:
+        if total <= limit_bytes:
+            break
+        if path == keep:
+            continue
+
+        remove(path)
+        total -= size
+        removed += 1
+
+    return removed
+
+def evict(limit_bytes, keep=None):
+    # least recently generated or reused renders go first, stored renders are never touched
+    if not os.path.isdir(RENDERS_DIR):
+        return 0
+
+    entries = []
+    for key in os.listdir(RENDERS_DIR):
+        path = os.path.join(RENDERS_DIR, key)
+        if key.endswith(".tmp"):
+            continue
+
+        entries.append((os.stat(path).st_mtime, directory_size(path), path))
+
+    return evict_oldest(entries, limit_bytes, shutil.rmtree, keep)
+
+def cache_render(directory, key, limit_bytes=None):
+    path = os.path.join(RENDERS_DIR, key)
+    replace_render(directory, path)
+
+    if limit_bytes is not None:
+        evict(limit_bytes, keep=path)
+
+    return path
@@ -0,0 +1,253 @@
+import os
+import json
+import hashlib
+import threading
+import collections
+import concurrent.futures
+import numpy as np
+
+from convert import UNICODE_BLOCK, pixel_size, resize_pixels, frame_to_text, convert_frames
+from sequence import SequenceReader, SequenceWriter
+from render_cache import evict_oldest
+
+MASTER_FILE = "master.bin"
+# a fixed grid renditions for other terminal sizes are made from, the video is stretched to the terminal anyway
+# renditions needing more pixels than this are enlarged from it, the render made with the master is not
+MASTER_SIZE = (320, 180)
+RENDITIONS_DIR = os.path.join("cache", "renditions")
+# terminal sizes kept open while playing, so going back to a recent window layout is instant
+RECENT_SIZES = 4
+
+def master_writer(path, framerate, info=None):
+    info = dict(info or {})
+    info["master"] = True
+    return SequenceWriter(path, MASTER_SIZE, framerate, info, "zlib")
+
+def decode_size(frame_size):
+    # frames decoded while recording a master have to be big enough for both the master and this render
+    return (max(MASTER_SIZE[0], frame_size[0]), max(MASTER_SIZE[1], frame_size[1]))
+
+def record_master(frames, writer, frame_size):
+    # stores every frame at the master size and passes it on resized for this render, both straight from the decoded frame
+    for pixels in frames:
+        writer.write(np.ascontiguousarray(resize_pixels(pixels, MASTER_SIZE)).tobytes())
+        yield resize_pixels(pixels, frame_size)
+
+def master_frames(master, frame_size=None):
+    width, height = master.terminal_size
+
+    for payload in master.frames_from(0):
+        pixels = np.frombuffer(payload, dtype=np.uint8).reshape(height, width, 3)
+        yield resize_pixels(pixels, frame_size) if frame_size else pixels
+
+def rendition_key(terminal_size, shading, color, tolerance, encoding="cell"):
+    settings = json.dumps([terminal_size, shading, color, tolerance, encoding])
+    return f"{terminal_size[0]}x{terminal_size[1]}-{hashlib.sha1(settings.encode()).hexdigest()[:12]}"
+
+def matches(info, terminal_size, shading, color, tolerance, encoding="cell"):
+    # whether an existing render already is what rendition() would make
+    return (
+        info.get("terminal_size") == list(terminal_size)
+        and info.get("cell_encoding", "cell") == encoding
+        and info.get("color") == color
+        and info.get("shading") == (shading if shading else UNICODE_BLOCK)
+        and (not color or info.get("color_tolerance", 0) == tolerance)
+    )
+
+def master_key(master_file):
+    # cheaper than hashing the whole file, and any rewrite changes the size or time
+    stat = os.stat(master_file)
+    identity = f"{os.path.abspath(master_file)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+def evict(limit_bytes, keep=None):
+    # least recently played renditions go first
+    if not os.path.isdir(RENDITIONS_DIR):
+        return 0
+
+    renditions = []
+    for directory in os.listdir(RENDITIONS_DIR):
+        for filename in os.listdir(os.path.join(RENDITIONS_DIR, directory)):
+            if filename.endswith(".tmp"):
+                continue
+
+            path = os.path.join(RENDITIONS_DIR, directory, filename)
+            stat = os.stat(path)
+            renditions.append((stat.st_atime, stat.st_size, path))
+
+    return evict_oldest(renditions, limit_bytes, remove_rendition, keep)
+
+def remove_rendition(path):
+    os.remove(path)
+
+    # the directory of a master copy goes with its last rendition
+    if not os.listdir(os.path.dirname(path)):
+        os.rmdir(os.path.dirname(path))
+
+def rendition_path(master_file, terminal_size, shading=None, color=False, tolerance=0, encoding="cell"):
+    directory = os.path.join(RENDITIONS_DIR, master_key(master_file))
+    return os.path.join(directory, rendition_key(terminal_size, shading, color, tolerance, encoding) + ".bin")
+
+def rendition(master_file, terminal_size, shading=None, color=False, tolerance=0, workers=1, limit_bytes=None, progress=None, encoding="cell", stop=None, start_method=None):
+    # returns the path of a sequence rendered from the master copy for this terminal size,
+    # and whether it came out of the cache, or None if stop was set before it finished
+    # start_method is passed on to convert_frames for the worker pool
+    path = rendition_path(master_file, terminal_size, shading, color, tolerance, encoding)
+
+    if os.path.isfile(path):
+        os.utime(path)
+        return path, True
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame_size = pixel_size((terminal_size[0], terminal_size[1] - 1), encoding)
+
+    with SequenceReader(master_file) as master:
+        info = {key: value for key, value in master.info.items() if key != "master"}
+        info["terminal_size"] = list(terminal_size)
+        info["color"] = color
+        info["shading"] = shading if shading else UNICODE_BLOCK
+        info["cell_encoding"] = encoding
+
+        if color:
+            info["color_encoding"] = "runs"
+            info["color_tolerance"] = tolerance
+
+        # written under a temporary name so an interrupted render is never picked up from the cache
+        with SequenceWriter(path + ".tmp", terminal_size, master.framerate, info) as writer:
+            frames = master_frames(master, frame_size)
+
+            for count, text_frame in enumerate(convert_frames(frames, shading, color, workers, start_method=start_method, color_runs=True, tolerance=tolerance, encoding=encoding), 1):
+                if stop and stop.is_set():
+                    break
+
+                writer.write(text_frame)
+
+                if progress and count % 100 == 0:
+                    progress(count, len(master))
+
+    if stop and stop.is_set():
+        os.remove(path + ".tmp")
+        return None, False
+
+    os.replace(path + ".tmp", path)
+
+    if limit_bytes is not None:
+        evict(limit_bytes, keep=path)
+
+    return path, False
+
+
+class LiveRendition:
+    # renders frames from the master copy one at a time as they are asked for,
+    # to play from while the full rendition for a new terminal size is still being made
+    def __init__(self, master_file, terminal_size, shading=None, color=False, tolerance=0, encoding="cell"):
+        self.master = SequenceReader(master_file)
+        self.terminal_size = list(terminal_size)
+        self.frame_size = pixel_size((terminal_size[0], terminal_size[1] - 1), encoding)
+        self.shading = shading
+        self.color = color
+        self.tolerance = tolerance
+        self.encoding = encoding
+
+    def __len__(self):
+        return len(self.master)
+
+    def __getitem__(self, number):
+        if not -len(self) <= number < len(self):
+            raise IndexError("frame number out of range")
+
+        width, height = self.master.terminal_size
+        pixels = np.frombuffer(self.master.frame_bytes(number % len(self)), dtype=np.uint8).reshape(height, width, 3)
+        return frame_to_text(resize_pixels(pixels, self.frame_size), self.shading, self.color, color_runs=True, tolerance=self.tolerance, encoding=self.encoding)
+
+    def close(self):
+        self.master.close()
+
+
+class Renditions:
+    # the renditions of one master copy for every terminal size played recently, the least recently used is closed first
+    # a size without a finished rendition plays from a LiveRendition while the real one renders on a thread
+    # frames that stop being open are only closed by release(), the caller may still be drawing from them
+    # not thread safe, everything but the rendering has to happen on one thread
+    def __init__(self, master_file, shading=None, color=False, tolerance=0, encoding="cell", workers=1, limit_bytes=None, recent=RECENT_SIZES):
+        self.master_file = master_file
+        self.settings = (shading, color, tolerance)
+        self.encoding = encoding
+        self.workers = workers
+        self.limit_bytes = limit_bytes
+        self.recent = recent
+
+        self.open = collections.OrderedDict()
+        self.dropped = []
+        self.rendering = {}
+        self.stop = threading.Event()
+        # one rendition at a time, so flipping between sizes does not start a render for each of them at once
+        # its workers are spawned, forking while the player's threads hold locks could leave a worker stuck on one
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    def add(self, terminal_size, frames):
+        terminal_size = tuple(terminal_size)
+
+        if terminal_size in self.open and self.open[terminal_size] is not frames:
+            self.dropped.append(self.open[terminal_size])
+
+        self.open[terminal_size] = frames
+        self.open.move_to_end(terminal_size)
+
+        while len(self.open) > self.recent:
+            self.dropped.append(self.open.popitem(last=False)[1])
+
+        return frames
+
+    def release(self, keep=None):
+        # closes the dropped frames, all but keep if it is still being drawn from
+        for frames in self.dropped:
+            if frames is not keep:
+                frames.close()
+
+        self.dropped = [frames for frames in self.dropped if frames is keep]
+
+    def get(self, terminal_size, ready=None):
+        # ready is called from the rendering thread with the terminal size once its rendition is finished
+        terminal_size = tuple(terminal_size)
+
+        if terminal_size in self.open:
+            self.open.move_to_end(terminal_size)
+            return self.open[terminal_size]
+
+        path = rendition_path(self.master_file, terminal_size, *self.settings, self.encoding)
+
+        if os.path.isfile(path):
+            os.utime(path)
+            return self.add(terminal_size, SequenceReader(path))
+
+        if terminal_size not in self.rendering:
+            self.rendering[terminal_size] = self.executor.submit(self.render, terminal_size, ready)
+
+        return self.add(terminal_size, LiveRendition(self.master_file, terminal_size, *self.settings, self.encoding))
+
+    def render(self, terminal_size, ready):
+        path, _ = rendition(self.master_file, terminal_size, *self.settings, self.workers, self.limit_bytes, encoding=self.encoding, stop=self.stop, start_method="spawn")
+
+        if path and ready:
+            ready(terminal_size)
+
+    def finished(self, terminal_size):
+        # swaps the live rendition for the finished one, if the size is still open
+        terminal_size = tuple(terminal_size)
+        self.rendering.pop(terminal_size, None)
+
+        if terminal_size not in self.open:
+            return None
+
+        path = rendition_path(self.master_file, terminal_size, *self.settings, self.encoding)
+        return self.add(terminal_size, SequenceReader(path))
+
+    def close(self):
+        self.stop.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+        while self.open:
+            self.open.popitem()[1].close()
+
+        self.release()
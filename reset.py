@@ -2,7 +2,7 @@ import os
 import shutil
 
 def reset_files():
-    for filename in ["video.webm", "audio.mp3", "ascii.txt"]:
+    for filename in ["video.webm", "audio.mp3", "ascii.txt", "sequence.bin", "info.json", "delta.bin", "master.bin"]:
         try:
             os.remove(os.path.join("assets", filename))
         except:
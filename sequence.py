@@ -0,0 +1,469 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import lzma
+import hashlib
+import queue
+import struct
+import threading
+import collections
+import numpy as np
+
+SEQUENCE_FILE = "sequence.bin"
+TEXT_FILE = "ascii.txt"
+INFO_FILE = "info.json"
+
+# magic, version, width, height, framerate, frame count, index offset, info offset, info length
+# frame payloads follow the header, the index and info are written at the end once they are known
+HEADER = struct.Struct("<8sHHHdQQQQ")
+# version 2 adds compression, frames per chunk and the chunk index offset
+EXTENSION = struct.Struct("<BxHQ")
+# version 3 stores every distinct frame once, followed by which of them each frame shows:
+# unique frame count and reference list offset, the index and chunks then cover unique frames
+DEDUP = struct.Struct("<QQ")
+MAGIC = b"BADAPPLE"
+VERSION = 3
+
+COMPRESSIONS = ["none", "zlib", "lzma"]
+CHUNK_FRAMES = 32
+CACHED_CHUNKS = 4
+PREFETCH_CHUNKS = 4
+
+def compress(data, compression):
+    if compression == "zlib":
+        return zlib.compress(data, 6)
+    if compression == "lzma":
+        return lzma.compress(data, preset=6)
+    return data
+
+def decompress(data, compression):
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lzma":
+        return lzma.decompress(data)
+    return data
+
+class SequenceWriter:
+    def __init__(self, path, terminal_size, framerate, info=None, compression="none", chunk_frames=CHUNK_FRAMES):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}'")
+
+        self.file = open(path, "wb")
+        self.terminal_size = terminal_size
+        self.framerate = framerate
+        self.info = info or {}
+        self.compression = compression
+        self.chunk_frames = chunk_frames if compression != "none" else 0
+        self.offsets = [0]
+        self.chunk_offsets = [0]
+        self.pending = []
+
+        # digest of every unique frame so far, and which unique frame each written frame is
+        self.uniques = {}
+        self.references = []
+        self.raw_size = 0
+
+        self.file.write(b"\0" * (HEADER.size + EXTENSION.size + DEDUP.size))
+
+    def write(self, frame):
+        if isinstance(frame, str):
+            frame = frame.encode()
+
+        self.raw_size += len(frame)
+        digest = hashlib.sha1(frame).digest()
+
+        if digest in self.uniques:
+            self.references.append(self.uniques[digest])
+            return
+
+        self.uniques[digest] = len(self.uniques)
+        self.references.append(self.uniques[digest])
+        self.offsets.append(self.offsets[-1] + len(frame))
+
+        if not self.chunk_frames:
+            self.file.write(frame)
+            return
+
+        self.pending.append(frame)
+        if len(self.pending) == self.chunk_frames:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        # every chunk can be decompressed on its own, so any frame is at most one chunk away
+        chunk = compress(b"".join(self.pending), self.compression)
+        self.file.write(chunk)
+        self.chunk_offsets.append(self.chunk_offsets[-1] + len(chunk))
+        self.pending = []
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        if self.pending:
+            self.flush_chunk()
+
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.offsets, dtype="<u8").tobytes())
+
+        references_offset = self.file.tell()
+        self.file.write(np.array(self.references, dtype="<u4").tobytes())
+
+        chunk_index_offset = self.file.tell()
+        if self.chunk_frames:
+            self.file.write(np.array(self.chunk_offsets, dtype="<u8").tobytes())
+
+        info_offset = self.file.tell()
+        info = json.dumps(self.info).encode()
+        self.file.write(info)
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(
+            MAGIC, VERSION,
+            self.terminal_size[0], self.terminal_size[1], self.framerate,
+            len(self.references), index_offset, info_offset, len(info)
+        ))
+        self.file.write(EXTENSION.pack(COMPRESSIONS.index(self.compression), self.chunk_frames, chunk_index_offset))
+        self.file.write(DEDUP.pack(len(self.offsets) - 1, references_offset))
+        self.file.close()
+
+    def unique_size(self):
+        return self.offsets[-1]
+
+    def savings(self):
+        # frames and bytes that repeated frames did not have to store again
+        return len(self.references) - len(self.uniques), self.raw_size - self.unique_size()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class SequenceReader:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, width, height, framerate, count, index_offset, info_offset, info_length = HEADER.unpack_from(self.map)
+
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a frame sequence")
+        if version > VERSION:
+            raise ValueError(f"'{path}' was made by a newer version (format {version})")
+
+        self.terminal_size = [width, height]
+        self.framerate = framerate
+        self.info = json.loads(self.map[info_offset:info_offset + info_length] or b"{}")
+
+        self.compression = "none"
+        self.chunk_frames = 0
+        self.chunk_index = None
+        # None when every frame is stored on its own, as in files before version 3
+        self.references = None
+        self.payload_offset = HEADER.size
+        self.cache = collections.OrderedDict()
+
+        self.count = count
+        unique_count = count
+
+        if version >= 3:
+            unique_count, references_offset = DEDUP.unpack_from(self.map, HEADER.size + EXTENSION.size)
+            self.references = np.frombuffer(self.map, dtype="<u4", count=count, offset=references_offset)
+            self.payload_offset += DEDUP.size
+
+        self.index = np.frombuffer(self.map, dtype="<u8", count=unique_count + 1, offset=index_offset)
+
+        if version >= 2:
+            compression, self.chunk_frames, chunk_index_offset = EXTENSION.unpack_from(self.map, HEADER.size)
+            self.compression = COMPRESSIONS[compression]
+            self.payload_offset += EXTENSION.size
+
+            if self.chunk_frames:
+                chunk_count = (unique_count + self.chunk_frames - 1) // self.chunk_frames
+                self.chunk_index = np.frombuffer(self.map, dtype="<u8", count=chunk_count + 1, offset=chunk_index_offset)
+
+    def chunk_count(self):
+        return len(self.chunk_index) - 1 if self.chunk_index is not None else 0
+
+    def decompress_chunk(self, chunk):
+        start = self.payload_offset + int(self.chunk_index[chunk])
+        end = self.payload_offset + int(self.chunk_index[chunk + 1])
+        return decompress(self.map[start:end], self.compression)
+
+    def chunk(self, chunk):
+        if chunk in self.cache:
+            self.cache.move_to_end(chunk)
+            return self.cache[chunk]
+
+        data = self.decompress_chunk(chunk)
+        self.cache[chunk] = data
+
+        if len(self.cache) > CACHED_CHUNKS:
+            self.cache.popitem(last=False)
+
+        return data
+
+    def chunk_frame(self, data, chunk, number):
+        base = int(self.index[chunk * self.chunk_frames])
+        return data[int(self.index[number]) - base:int(self.index[number + 1]) - base]
+
+    def unique_count(self):
+        return len(self.index) - 1
+
+    def unique(self, number):
+        return int(self.references[number]) if self.references is not None else number
+
+    def unique_bytes(self, unique):
+        if self.chunk_frames:
+            chunk = unique // self.chunk_frames
+            return self.chunk_frame(self.chunk(chunk), chunk, unique)
+
+        start = self.payload_offset + int(self.index[unique])
+        end = self.payload_offset + int(self.index[unique + 1])
+        return self.map[start:end]
+
+    def frame_bytes(self, number):
+        return self.unique_bytes(self.unique(number))
+
+    def prefetched_chunks(self, first_chunk):
+        # zlib and lzma let go of the GIL, so a thread can decompress ahead of the playhead
+        chunks = queue.Queue(maxsize=PREFETCH_CHUNKS)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def prefetch():
+            for chunk in range(first_chunk, self.chunk_count()):
+                if not put((chunk, self.decompress_chunk(chunk))):
+                    return
+
+            put(None)
+
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    return
+                yield item
+
+        finally:
+            stop.set()
+            thread.join()
+
+    def uniques_from(self, start=0):
+        if not self.chunk_frames:
+            for unique in range(start, self.unique_count()):
+                yield self.unique_bytes(unique)
+            return
+
+        for chunk, data in self.prefetched_chunks(start // self.chunk_frames):
+            first = max(chunk * self.chunk_frames, start)
+            last = min((chunk + 1) * self.chunk_frames, self.unique_count())
+
+            for unique in range(first, last):
+                yield self.chunk_frame(data, chunk, unique)
+
+    def frames_from(self, start=0):
+        # a repeated frame is the very same bytes object as the last time it was shown
+        if self.references is None:
+            yield from self.uniques_from(start)
+            return
+
+        # unique frames are stored in the order they first appear, so only repeats need a lookup
+        upcoming = int(self.references[:start].max()) + 1 if start else 0
+        uniques = self.uniques_from(upcoming)
+        shown = None
+        frame = None
+
+        try:
+            for number in range(start, len(self)):
+                unique = int(self.references[number])
+
+                if unique == upcoming:
+                    frame = next(uniques)
+                    upcoming += 1
+                elif unique != shown:
+                    frame = self.unique_bytes(unique)
+
+                shown = unique
+                yield frame
+
+        finally:
+            uniques.close()
+
+    def raw_size(self):
+        # what the frames take up without compression or deduplication
+        if self.references is None:
+            return int(self.index[-1])
+
+        lengths = np.diff(self.index)
+        return int(lengths[self.references].sum())
+
+    def unique_size(self):
+        return int(self.index[-1])
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, number):
+        if not -len(self) <= number < len(self):
+            raise IndexError("frame number out of range")
+        return self.frame_bytes(number % len(self)).decode()
+
+    def __iter__(self):
+        # repeats come out as the same string too, so comparing them with the last frame is free
+        previous = None
+        text = None
+
+        for frame in self.frames_from(0):
+            if frame is not previous:
+                text = frame.decode()
+                previous = frame
+            yield text
+
+    def close(self):
+        # the numpy indexes are views of the map, they have to go first
+        self.index = None
+        self.chunk_index = None
+        self.references = None
+        self.cache.clear()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class TextSequence:
+    # an old newline separated ascii.txt, read from disk a frame at a time through the offset of every line
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.info = {}
+
+        offsets = [0]
+        for line in self.file:
+            offsets.append(offsets[-1] + len(line))
+
+        self.offsets = np.array(offsets, dtype=np.uint64)
+
+    def line(self, data):
+        return data.rstrip(b"\r\n")
+
+    def frames_from(self, start=0):
+        # a file of its own, so reading through it does not move the one __getitem__ seeks in
+        with open(self.path, "rb") as f:
+            f.seek(int(self.offsets[start]))
+            for number in range(start, len(self)):
+                yield self.line(f.readline())
+
+    def raw_size(self):
+        return int(self.offsets[-1])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, number):
+        if not -len(self) <= number < len(self):
+            raise IndexError("frame number out of range")
+
+        self.file.seek(int(self.offsets[number % len(self)]))
+        return self.line(self.file.readline()).decode()
+
+    def __iter__(self):
+        for frame in self.frames_from(0):
+            yield frame.decode()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def has_sequence(directory):
+    return os.path.isfile(os.path.join(directory, SEQUENCE_FILE)) or os.path.isfile(os.path.join(directory, TEXT_FILE))
+
+def open_sequence(directory):
+    # old renders only have the newline separated ascii.txt
+    sequence_file = os.path.join(directory, SEQUENCE_FILE)
+
+    if os.path.isfile(sequence_file):
+        return SequenceReader(sequence_file)
+
+    return TextSequence(os.path.join(directory, TEXT_FILE))
+
+def read_info(directory):
+    info_file = os.path.join(directory, INFO_FILE)
+
+    if os.path.isfile(info_file):
+        with open(info_file, "r") as f:
+            return json.load(f)
+
+    with open_sequence(directory) as sequence:
+        return sequence.info
+
+def store_sequence(source, destination, compression="zlib", chunk_frames=CHUNK_FRAMES):
+    # writes the render in source to destination/sequence.bin with the given compression
+    info = read_info(source)
+    sequence = open_sequence(source)
+    count = 0
+
+    with SequenceWriter(os.path.join(destination, SEQUENCE_FILE), info.get("terminal_size", [0, 0]), info.get("framerate", 30), info, compression, chunk_frames) as writer:
+        for frame in sequence:
+            writer.write(frame)
+            count += 1
+
+    sequence.close()
+    return count
+
+def convert_text(directory):
+    text_file = os.path.join(directory, TEXT_FILE)
+    info_file = os.path.join(directory, INFO_FILE)
+
+    if os.path.isfile(info_file):
+        with open(info_file, "r") as f:
+            info = json.load(f)
+    else:
+        info = {}
+
+    terminal_size = info.get("terminal_size", [0, 0])
+    count = 0
+
+    with open(text_file, "r") as source, SequenceWriter(os.path.join(directory, SEQUENCE_FILE), terminal_size, info.get("framerate", 30), info) as writer:
+        for line in source:
+            writer.write(line.rstrip("\n"))
+            count += 1
+
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        directory = sys.argv[1]
+    else:
+        directory = input("Convert which render directory? (e.g. stored/name): ")
+
+    if not os.path.isfile(os.path.join(directory, TEXT_FILE)):
+        print(f"There is no {TEXT_FILE} in '{directory}'")
+        sys.exit(1)
+
+    count = convert_text(directory)
+    print(f"Converted {count} frames to {os.path.join(directory, SEQUENCE_FILE)}")
+
+    if input(f"Delete the old {TEXT_FILE}? [y/N]: ").lower() in ["yes", "y"]:
+        os.remove(os.path.join(directory, TEXT_FILE))
\ No newline at end of file
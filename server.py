@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+
+from sequence import SEQUENCE_FILE, SequenceReader
+from output import CURSOR_HOME, HIDE_CURSOR, SHOW_CURSOR
+
+PORT = 2323
+CLEAR = b"\033[2J"
+RESET = b"\033[0m"
+
+# frames a slow client may have waiting before it starts losing frames instead
+BACKLOG_FRAMES = 2
+# a load test step counts as sustained while clients lose fewer frames than this
+SUSTAINED_DROPS = 0.05
+
+def cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+class SharedFrames:
+    # every frame of a stored render encoded once, ready to send, for all connections to share
+    def __init__(self, directory):
+        with SequenceReader(os.path.join(directory, SEQUENCE_FILE)) as sequence:
+            self.terminal_size = sequence.terminal_size
+            self.framerate = sequence.framerate
+
+            # a repeated frame is the same bytes object, so it is only kept once and can be skipped when sending
+            encoded = {}
+            self.frames = []
+
+            for number, frame in enumerate(sequence.frames_from(0)):
+                unique = sequence.unique(number)
+                if unique not in encoded:
+                    encoded[unique] = CURSOR_HOME + bytes(frame)
+                self.frames.append(encoded[unique])
+
+        self.size = sum(len(frame) for frame in encoded.values())
+        self.backlog = BACKLOG_FRAMES * max(len(frame) for frame in self.frames)
+
+class Client:
+    def __init__(self, number, address):
+        self.number = number
+        self.address = address
+        self.sent = 0
+        self.repeated = 0
+        self.dropped = 0
+
+    def summary(self):
+        return {"sent": self.sent, "repeated": self.repeated, "dropped": self.dropped}
+
+class StreamServer:
+    # each connection gets the render from the start, paced by its own clock
+    def __init__(self, frames, loop_video=False):
+        self.frames = frames
+        self.loop_video = loop_video
+        self.clients = {}
+        self.finished = []
+        self.connections = 0
+
+    def banner(self):
+        width, height = self.frames.terminal_size
+        return f"Bad Apple!! stream, set your terminal to {width}x{height}\r\n".encode()
+
+    async def stream(self, client, writer):
+        frames = self.frames.frames
+        period = 1 / self.frames.framerate
+        loop = asyncio.get_running_loop()
+        origin = loop.time()
+        number = 0
+        previous = None
+
+        while number < len(frames) or self.loop_video:
+            if number >= len(frames):
+                origin += len(frames) * period
+                number = 0
+
+            delay = origin + number * period - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            # frames this client is already past are never sent
+            due = int((loop.time() - origin) / period)
+            if due > number:
+                client.dropped += min(due, len(frames)) - number
+                number = min(due, len(frames))
+                continue
+
+            frame = frames[number]
+            number += 1
+
+            if frame is previous:
+                client.repeated += 1
+            elif writer.transport.get_write_buffer_size() > self.frames.backlog:
+                # the connection cannot keep up, buffering more would only add delay
+                client.dropped += 1
+            else:
+                writer.write(frame)
+                client.sent += 1
+                previous = frame
+
+            if writer.is_closing():
+                return
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        client = Client(self.connections, writer.get_extra_info("peername"))
+        self.clients[client.number] = client
+
+        try:
+            writer.write(self.banner() + CLEAR + HIDE_CURSOR)
+            await self.stream(client, writer)
+
+            writer.write(RESET + SHOW_CURSOR + b"\r\n")
+            await writer.drain()
+
+        except (ConnectionError, OSError):
+            pass
+
+        finally:
+            del self.clients[client.number]
+            self.finished.append(client)
+            writer.close()
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self.handle, host, port)
+
+async def read_all(host, port, seconds):
+    # a client that reads as fast as it can and throws everything away
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        return False
+
+    end = time.monotonic() + seconds
+
+    while time.monotonic() < end:
+        try:
+            if not await asyncio.wait_for(reader.read(65536), max(end - time.monotonic(), 0.01)):
+                break
+        except asyncio.TimeoutError:
+            break
+
+    writer.close()
+    return True
+
+async def run_clients(host, port, count, seconds):
+    connected = await asyncio.gather(*(read_all(host, port, seconds) for _ in range(count)))
+    print(sum(connected))
+
+async def load_step(server, host, port, count, seconds):
+    # clients run in their own process, so only the server's cpu time is counted
+    server.finished.clear()
+    start_cpu = cpu_seconds()
+
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--clients", str(count), "--seconds", str(seconds), "--port", str(port), "--host", host,
+        stdout=subprocess.PIPE
+    )
+    output, _ = await process.communicate()
+
+    # let the server notice the last disconnects
+    while server.clients:
+        await asyncio.sleep(0.05)
+
+    cpu = cpu_seconds() - start_cpu
+    connected = int(output or 0)
+    sent = sum(client.sent + client.repeated for client in server.finished)
+    dropped = sum(client.dropped for client in server.finished)
+
+    return connected, dropped / max(sent + dropped, 1), cpu
+
+async def load_test(frames, host, most, seconds):
+    server = StreamServer(frames, loop_video=True)
+    tcp = await server.serve(host, 0)
+    port = tcp.sockets[0].getsockname()[1]
+    sustained = 0
+    count = 1
+
+    print(f"Load test, {seconds} s per step on {host}:{port}")
+
+    async with tcp:
+        while count <= most:
+            connected, drops, cpu = await load_step(server, host, port, count, seconds)
+            per_client = cpu / max(connected, 1) / seconds * 100
+
+            print(f"  {count:>5} clients   {connected:>5} connected   {drops * 100:6.2f}% frames dropped   {cpu / seconds * 100:6.1f}% cpu   {per_client:6.3f}% cpu per client")
+
+            if connected < count or drops > SUSTAINED_DROPS:
+                break
+
+            sustained = count
+            count *= 2
+
+    print(f"Sustained {sustained} clients with under {SUSTAINED_DROPS * 100:.0f}% of frames dropped")
+
+async def serve_forever(frames, host, port, loop_video):
+    server = StreamServer(frames, loop_video)
+    tcp = await server.serve(host, port)
+
+    print(f"Streaming on {host}:{port}, connect with: telnet {host} {port}")
+
+    async with tcp:
+        await tcp.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a stored render to many terminals over TCP")
+    parser.add_argument("name", nargs="?", help="render in stored/<name>")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1, 0.0.0.0 for everyone)")
+    parser.add_argument("--port", type=int, default=PORT, help=f"port to listen on (default {PORT})")
+    parser.add_argument("--loop", action="store_true", help="start the video again when it ends")
+    parser.add_argument("--load-test", type=int, metavar="CLIENTS", help="connect up to this many loopback clients, doubling from 1, and report how many keep up")
+    parser.add_argument("--seconds", type=float, default=5, help="length of every load test step (default 5)")
+    parser.add_argument("--clients", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # the load test's client process
+    if args.clients:
+        asyncio.run(run_clients(args.host, args.port, args.clients, args.seconds))
+        sys.exit()
+
+    if not args.name:
+        parser.error("the name of a stored render is required")
+
+    directory = os.path.join("stored", args.name)
+    if not os.path.isfile(os.path.join(directory, SEQUENCE_FILE)):
+        print(f"There is no {SEQUENCE_FILE} in '{directory}', old ascii.txt renders can be converted with sequence.py")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    frames = SharedFrames(directory)
+    print(f"Loaded {len(frames.frames)} frames ({frames.size / 2**20:.1f} MiB) in {time.perf_counter() - start:.1f} s")
+
+    try:
+        if args.load_test:
+            asyncio.run(load_test(frames, args.host, args.load_test, args.seconds))
+        else:
+            asyncio.run(serve_forever(frames, args.host, args.port, args.loop))
+
+    except KeyboardInterrupt:
+        pass
@@ -2,6 +2,8 @@ import os
 import sys
 import shutil
 
+from sequence import store_sequence
+
 if not os.path.isdir("stored"):
     os.mkdir("stored")
 
@@ -18,13 +20,20 @@ if len(sys.argv) > 1:
 else:
     name = input_name()
 
+compression = sys.argv[2] if len(sys.argv) > 2 else "zlib"
+
 storage_dir = os.path.join("stored", name)
 assets = os.listdir("assets")
 
-if "audio.mp3" in assets and "ascii.txt" in assets:
+if "audio.mp3" in assets and ("sequence.bin" in assets or "ascii.txt" in assets):
     os.mkdir(storage_dir)
-    shutil.copy(os.path.join("assets", "audio.mp3"), storage_dir)
-    shutil.copy(os.path.join("assets", "ascii.txt"), storage_dir)
+
+    for filename in ["audio.mp3", "info.json", "delta.bin", "master.bin"]:
+        if filename in assets:
+            shutil.copy(os.path.join("assets", filename), storage_dir)
+
+    store_sequence("assets", storage_dir, compression)
+
     print(f"Stored render in '{storage_dir}'")
 
 else:
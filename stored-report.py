@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+from sequence import SEQUENCE_FILE, SequenceReader, has_sequence, open_sequence
+
+def report(directory):
+    sequence_file = os.path.join(directory, SEQUENCE_FILE)
+
+    if os.path.isfile(sequence_file):
+        sequence = SequenceReader(sequence_file)
+        compression = sequence.compression
+        raw_size = sequence.raw_size()
+        unique = sequence.unique_count()
+        stored_size = os.path.getsize(sequence_file)
+
+    else:
+        sequence = open_sequence(directory)
+        compression = "text"
+        raw_size = sequence.raw_size()
+        stored_size = os.path.getsize(sequence.path)
+        unique = len(set(sequence))
+
+    # only reading every frame once is timed, the text format's unique count above is a pass of its own
+    start = time.perf_counter()
+    count = 0
+    for frame in sequence:
+        count += 1
+    seconds = max(time.perf_counter() - start, 1e-9)
+
+    sequence.close()
+
+    return compression, count, unique, raw_size, stored_size, count / seconds, raw_size / seconds
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        names = sys.argv[1:]
+    elif os.path.isdir("stored"):
+        names = sorted(os.listdir("stored"))
+    else:
+        names = []
+
+    if not names:
+        print("No stored renders found")
+
+    print(f"{'name':<24} {'format':<6} {'frames':>7} {'unique':>7} {'raw MiB':>9} {'stored MiB':>11} {'ratio':>6} {'decode fps':>11} {'decode MiB/s':>13}")
+
+    for name in names:
+        directory = os.path.join("stored", name)
+
+        if not has_sequence(directory):
+            print(f"{name:<24} no sequence found")
+            continue
+
+        compression, count, unique, raw_size, stored_size, fps, throughput = report(directory)
+        print(f"{name:<24} {compression:<6} {count:>7} {unique:>7} {raw_size / 2**20:>9.1f} {stored_size / 2**20:>11.1f} {raw_size / max(stored_size, 1):>6.1f} {fps:>11.0f} {throughput / 2**20:>13.1f}")